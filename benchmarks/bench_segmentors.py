@@ -0,0 +1,255 @@
+"""
+Throughput / memory benchmark of the segmentors on synthetic chats.
+
+Each (segmentor, size) case runs in a fresh child process, so the peak RSS it reports
+belongs to that case alone. Chats and stand-in models are generated once into
+--work-dir and reused. Results go to a JSON file; --compare prints the speedup
+against an earlier results file, e.g. one produced on another commit:
+
+    python benchmarks/bench_segmentors.py --sizes 1e4 1e5 1e6
+    python benchmarks/bench_segmentors.py --sizes 1e7 --segmentors timegap hybrid
+    python benchmarks/bench_segmentors.py --compare benchmarks/results/old.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.synthetic_chat import ChatSpec, build_stand_in_models, write_chat_json  # noqa: E402
+
+SEGMENTORS = ("timegap", "reply", "hybrid")
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss survives exec on Linux (the child would report the parent's peak), VmHWM does not
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class _Timer:
+    def __init__(self) -> None:
+        self.stages: Dict[str, float] = {}
+
+    def __call__(self, name: str, fn: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        out = fn()
+        self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+        return out
+
+
+def _run_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Runs in the child: load, end-to-end segment(), then the same work stage by stage.
+    """
+    import numpy as np
+
+    from topic_segmentor import (
+        HybridTimeGapMLTopicSegmentor,
+        MessageStore,
+        ReplyChainTopicSegmentor,
+        TimeGapTopicSegmentor,
+    )
+    from topic_segmentor.reply_segmentor import ReplyForest
+
+    k = case["topic_size"]
+    t = _Timer()
+    store = t("load", lambda: MessageStore.load(case["chat_path"]))
+
+    name = case["segmentor"]
+    if name == "timegap":
+        seg = TimeGapTopicSegmentor(case["max_gap_seconds"], k)
+    elif name == "reply":
+        seg = ReplyChainTopicSegmentor(topic_size=k)
+    else:
+        seg = HybridTimeGapMLTopicSegmentor(
+            case["max_gap_seconds"],
+            k,
+            case["threshold"],
+            tfidf_path=case["tfidf_path"],
+            model_path=case["model_path"],
+        )
+
+    start = time.perf_counter()
+    n_topics = len(seg.segment(store))
+    segment_s = time.perf_counter() - start
+
+    stages = _Timer()
+    if name == "timegap":
+        stages("split", lambda: seg.topic_ranges(store.timestamps))
+    elif name == "reply":
+        forest = stages("split", lambda: ReplyForest.from_messages(store))
+        stages("select", lambda: seg._candidate_windows(forest, k))
+    else:
+        model = seg._model
+        bounds = stages("split", lambda: seg._split_sessions(store.timestamps))
+        starts, ends = stages("split", lambda: seg._windows(bounds, k))
+        cache = stages("featurize", lambda: model._message_cache(store))
+        probas = np.empty(len(starts), dtype=np.float64)
+        for lo in range(0, len(starts), model.batch_size):
+            chunk = starts[lo : lo + model.batch_size]
+            x = stages("featurize", lambda: model.featurize_windows(store, chunk, cache))
+            probas[lo : lo + len(chunk)] = stages("predict", lambda: model.gbdt.predict_proba(x)[:, 1])
+        stages("select", lambda: seg._select_non_overlapping(starts, ends, probas))
+
+    total = t.stages["load"] + segment_s
+    return {
+        "messages": len(store),
+        "topics": n_topics,
+        "seconds": total,
+        "msgs_per_s": len(store) / total if total > 0 else None,
+        "peak_rss_mb": _peak_rss_mb(),
+        "stages": {"load": t.stages["load"], "segment": segment_s, **stages.stages},
+    }
+
+
+def _child(case: Dict[str, Any]) -> Dict[str, Any]:
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-case", json.dumps(case)],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import numpy as np
+
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def _compare(results: List[Dict[str, Any]], baseline_path: str) -> None:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["segmentor"], r["messages_requested"]): r for r in json.load(f)["results"]}
+    print(f"\nvs {baseline_path} (speedup = old seconds / new seconds):")
+    for r in results:
+        old = baseline.get((r["segmentor"], r["messages_requested"]))
+        if not old or "seconds" not in old or "seconds" not in r:
+            continue
+        print(
+            f"  {r['segmentor']:8} {r['messages_requested']:>10}: x{old['seconds'] / r['seconds']:.2f}, "
+            f"rss {old['peak_rss_mb']:.0f} -> {r['peak_rss_mb']:.0f} MB"
+        )
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=float, default=[1e4, 1e5, 1e6], help="message counts, e.g. 1e4 1e7")
+    parser.add_argument("--segmentors", nargs="+", choices=SEGMENTORS, default=list(SEGMENTORS))
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--reply-density", type=float, default=0.3)
+    parser.add_argument("--mean-gap", type=float, default=45.0, help="mean gap inside a topic, seconds")
+    parser.add_argument("--long-gap-prob", type=float, default=0.02)
+    parser.add_argument("--max-words", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--topic-size", type=int, default=4)
+    parser.add_argument("--max-gap-seconds", type=int, default=300)
+    parser.add_argument("--threshold", type=float, default=0.7)
+    parser.add_argument("--model-format", choices=("joblib", "artifacts"), default="joblib")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "topic_segmentor_bench"))
+    parser.add_argument("--out", default=None, help="results JSON (default: benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results JSON to compare with")
+    parser.add_argument("--run-case", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        print(json.dumps(_run_case(json.loads(args.run_case))))
+        return 0
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    tfidf_path, model_path = "", ""
+    if "hybrid" in args.segmentors:
+        print("Preparing stand-in models...")
+        tfidf_path, model_path = build_stand_in_models(os.path.join(args.work_dir, "models"), args.topic_size, args.seed)
+        if args.model_format == "artifacts":
+            artifacts = os.path.join(args.work_dir, "models", "window_model")
+            tfidf_path, model_path = os.path.join(artifacts, "vectorizer"), os.path.join(artifacts, "gbdt")
+
+    env = _environment()
+    results: List[Dict[str, Any]] = []
+    for size in sorted(int(s) for s in args.sizes):
+        spec = ChatSpec(
+            n_messages=size,
+            n_users=args.users,
+            reply_density=args.reply_density,
+            mean_gap_seconds=args.mean_gap,
+            long_gap_prob=args.long_gap_prob,
+            max_words=args.max_words,
+            seed=args.seed,
+        )
+        chat_path = os.path.join(args.work_dir, f"chat-{spec.key()}.json")
+        if not os.path.exists(chat_path):
+            start = time.perf_counter()
+            write_chat_json(chat_path, spec)
+            print(f"Generated {size} messages in {time.perf_counter() - start:.1f}s: {chat_path}")
+
+        for name in args.segmentors:
+            case = {
+                "segmentor": name,
+                "chat_path": chat_path,
+                "topic_size": args.topic_size,
+                "max_gap_seconds": args.max_gap_seconds,
+                "threshold": args.threshold,
+                "tfidf_path": tfidf_path,
+                "model_path": model_path,
+            }
+            res = {"segmentor": name, "messages_requested": size, "spec": asdict(spec), **_child(case)}
+            results.append(res)
+            if "error" in res:
+                print(f"{name:8} {size:>10}: FAILED {res['error']}")
+                continue
+            stages = ", ".join(f"{k} {v:.2f}s" for k, v in res["stages"].items())
+            print(
+                f"{name:8} {size:>10}: {res['msgs_per_s']:>10.0f} msgs/s, peak {res['peak_rss_mb']:.0f} MB, "
+                f"{res['topics']} topics ({stages})"
+            )
+
+    out = args.out
+    if out is None:
+        out = os.path.join(REPO_ROOT, "benchmarks", "results", f"{env['commit'] or 'nogit'}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"environment": env, "args": {k: v for k, v in vars(args).items() if k != "run_case"}, "results": results}, f, indent=2)
+    print(f"Saved {out}")
+
+    if args.compare:
+        _compare(results, args.compare)
+    return 1 if any("error" in r for r in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,323 @@
+"""
+Equivalence checks for the optimized code paths against their plain reference versions.
+
+Each check builds random synthetic inputs and compares the fast implementation with
+the straightforward one it replaced; exits with 1 on any mismatch, so it can run as
+a CI step next to the benchmarks:
+
+    python benchmarks/check_invariants.py
+    python benchmarks/check_invariants.py --checks tfidf --rounds 5 --seed 3
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.synthetic_chat import ChatSpec, _generate  # noqa: E402
+from topic_segmentor.topic_segmentor import ChatMessage, parse_message  # noqa: E402
+
+
+def _messages(n: int, seed: int, **spec) -> List[ChatMessage]:
+    return [parse_message(item) for item, _ in _generate(ChatSpec(n_messages=n, seed=seed, **spec))]
+
+
+def _json_value(rng: np.random.Generator, depth: int = 0) -> object:
+    kind = int(rng.integers(0, 9 if depth < 3 else 6))
+    if kind == 0:
+        return int(rng.integers(-(10**12), 10**12)) * int(rng.choice([1, 1, 10**8]))
+    if kind == 1:
+        return float(rng.normal() * 10.0 ** int(rng.integers(-30, 30)))
+    if kind == 2:
+        return float(rng.choice([0.5, -0.0, 1e-7, 12.5, 1.25e300, float("inf"), float("-inf"), float("nan")]))
+    if kind == 3:
+        return bool(rng.integers(0, 2)) if rng.random() < 0.7 else None
+    if kind in (4, 5):
+        # brackets, commas and quotes inside strings, escapes and non-ASCII (incl. surrogate pairs)
+        parts = ["]", "[", "{", "}", ",", '"', "\\", "\\]", "\n", "\t", "привет", "ё", "😀", " ", "x", " "]
+        return "".join(rng.choice(parts, int(rng.integers(0, 8))).tolist())
+    if kind in (6, 7):
+        return {str(_json_value(rng, 3)): _json_value(rng, depth + 1) for _ in range(int(rng.integers(0, 4)))}
+    return [_json_value(rng, depth + 1) for _ in range(int(rng.integers(0, 4)))]
+
+
+def check_json_stream(rng: np.random.Generator, seed: int) -> List[str]:
+    """
+    iter_json_array == json.load for arrays of random values read in tiny chunks, so that
+    numbers, literals, escapes and non-ASCII characters get cut at every position; a syntax
+    error in an element raises JSONDecodeError.
+    """
+    import json
+    import tempfile
+
+    from topic_segmentor.message_stream import iter_json_array
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "chat.json")
+        for doc in range(30):
+            # top-level numbers are the ones a chunk border can cut into a shorter valid number
+            values = []
+            for _ in range(int(rng.integers(0, 12))):
+                r = rng.random()
+                values.append(_json_value(rng) if r < 0.6 else _json_value(rng, 3) if r < 0.8 else float(rng.normal() * 1e6))
+            text = json.dumps(
+                values,
+                ensure_ascii=bool(rng.integers(0, 2)),
+                indent=None if rng.random() < 0.5 else int(rng.integers(0, 3)),
+                separators=None if rng.random() < 0.5 else (",", ":"),
+            )
+            want = json.dumps(json.loads(text))
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(("\ufeff" if rng.random() < 0.2 else "") + text + " " * int(rng.integers(0, 3)))
+            for chunk_size in sorted(set(rng.integers(1, 65, 8).tolist()) | {1, 2, 3}):
+                try:
+                    got = json.dumps(list(iter_json_array(path, chunk_size)))
+                except ValueError as e:
+                    failures.append(f"doc {doc} chunk_size={chunk_size}: {e}")
+                    continue
+                if got != want:
+                    failures.append(f"doc {doc} chunk_size={chunk_size}: elements differ")
+
+            if len(values) < 2:
+                continue
+            # break one element: a cut literal, a missing key or colon, a trailing comma, a hex number
+            bad = json.dumps(values[:1])[:-1] + ", " + str(rng.choice(["tru", "{:1}", '{"a" 1}', "[1,]", "0x1"]))
+            bad += ", " + json.dumps(values[1:])[1:]
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(bad)
+            for chunk_size in (1, 7, 64):
+                try:
+                    list(iter_json_array(path, chunk_size))
+                    failures.append(f"doc {doc} chunk_size={chunk_size}: no error on {bad!r}")
+                except json.JSONDecodeError:
+                    pass
+    return failures
+
+
+def check_tfidf(rng: np.random.Generator, seed: int) -> List[str]:
+    """
+    MessageTfidfCache.window_cos == WindowTopicModel._tfidf_cos of the joined window text,
+    for the vectorizer settings the cache supports and for the memory-mapped vectorizer.
+    """
+    from dataclasses import replace
+
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    from topic_segmentor.message_tfidf_cache import MessageTfidfCache
+    from topic_segmentor.model_artifacts import MmapTfidfVectorizer
+    from topic_segmentor.window_topic_model import WindowTopicModel
+
+    msgs = _messages(2000, seed, vocab_size=800, n_topic_words=60)
+    # messages without tokens break the chain of cross-message bigrams
+    for i in rng.choice(len(msgs), len(msgs) // 20, replace=False).tolist():
+        msgs[i] = replace(msgs[i], text=str(rng.choice(["??", "...", "!"])))
+    texts = [f"{m.user}: {m.text}" for m in msgs]
+    corpus = ["\n".join(texts[i : i + 4]) for i in range(0, len(texts) - 4, 3)]
+
+    settings = [
+        dict(ngram_range=(1, 2)),
+        dict(ngram_range=(1, 1)),
+        dict(ngram_range=(2, 2)),
+        dict(ngram_range=(1, 2), lowercase=False, max_features=500),
+        dict(ngram_range=(1, 2), stop_words=["user1", "user2", "каро"], use_idf=False),
+    ]
+    failures = []
+    for params in settings:
+        tfidf = TfidfVectorizer(**params).fit(corpus)
+        for name, vectorizer in (("sklearn", tfidf), ("mmap", MmapTfidfVectorizer.from_sklearn(tfidf))):
+            model = WindowTopicModel(tfidf_feat=vectorizer, gbdt=None)
+            cache = MessageTfidfCache(model.message_analyzer(), texts)
+            for k in (2, 3, 4, 5):
+                starts = np.sort(rng.choice(len(msgs) - k + 1, 150, replace=False))
+                got = cache.window_cos(starts, k)
+                want = np.array(
+                    [model._tfidf_cos("\n".join(texts[s : s + k - 1]), texts[s + k - 1]) for s in starts.tolist()]
+                )
+                err = float(np.max(np.abs(got - want)))
+                if err > 1e-9:
+                    failures.append(f"{name} {params} k={k}: max |diff| {err:.2e}")
+    return failures
+
+
+def check_gbdt(rng: np.random.Generator, seed: int) -> List[str]:
+    """
+    CompiledGBDT.predict_proba and predict == HistGradientBoostingClassifier's, bit for bit,
+    with missing values in training and at predict time, also after save/load.
+    """
+    import tempfile
+
+    from sklearn.ensemble import HistGradientBoostingClassifier
+
+    from topic_segmentor.compiled_gbdt import CompiledGBDT
+
+    n_features = 9
+    X = rng.normal(size=(4000, n_features))
+    y = (X[:, 0] + X[:, 1] * X[:, 2] + rng.normal(scale=0.5, size=len(X)) > 0).astype(np.int64)
+    X[:, 3] = np.round(X[:, 3])
+    X[rng.random(X.shape) < 0.1] = np.nan
+    X[:, 5] = rng.normal(size=len(X))  # no missing values in training, only at predict time
+    X_test = rng.normal(size=(3000, n_features))  # more than one traversal chunk
+    X_test[:, 3] = np.round(X_test[:, 3])
+    nan_mask = rng.random(X_test.shape) < 0.15
+    nan_mask[:, 5] = True
+
+    settings = [
+        dict(max_iter=1, max_depth=1),
+        dict(max_iter=30, max_depth=3),
+        dict(max_iter=100, max_leaf_nodes=31),
+        dict(max_iter=60, max_depth=8, learning_rate=0.3, l2_regularization=1.0),
+    ]
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for params in settings:
+            for labels in (np.array([0, 1]), np.array(["no", "yes"])):
+                gbdt = HistGradientBoostingClassifier(random_state=seed, early_stopping=False, **params)
+                gbdt.fit(X, labels[y])
+                compiled = CompiledGBDT.from_sklearn(gbdt)
+                # inputs exactly on the split thresholds check the side ties go to
+                X_cur = X_test.copy()
+                split = compiled.left != np.arange(len(compiled.left))
+                for f in range(n_features):
+                    thresholds = compiled.threshold[split & (compiled.feature == f)]
+                    if len(thresholds):
+                        on = rng.random(len(X_cur)) < 0.3
+                        X_cur[on, f] = rng.choice(thresholds, int(on.sum()))
+                X_cur[nan_mask] = np.nan
+                want, want_labels = gbdt.predict_proba(X_cur), gbdt.predict(X_cur)
+
+                compiled.save(os.path.join(tmp, "gbdt.npz"))
+                compiled.save(os.path.join(tmp, "gbdt"))
+                for name, model in (
+                    ("compiled", compiled),
+                    ("npz", CompiledGBDT.load(os.path.join(tmp, "gbdt.npz"))),
+                    ("mmap", CompiledGBDT.load(os.path.join(tmp, "gbdt"))),
+                ):
+                    got = model.predict_proba(X_cur)
+                    if not np.array_equal(got, want):
+                        err = float(np.max(np.abs(got - want)))
+                        failures.append(f"{name} {params} labels={labels.tolist()}: max |diff| {err:.2e}")
+                    if not np.array_equal(model.predict(X_cur), want_labels):
+                        failures.append(f"{name} {params} labels={labels.tolist()}: predict differs")
+    return failures
+
+
+def _reply_messages(rng: np.random.Generator, n: int) -> List[ChatMessage]:
+    # duplicated ids, dangling and forward replies, self-replies and cycles, tied timestamps
+    ids = rng.integers(1, int(n * 1.1), n)
+    replies = ids[np.maximum(0, np.arange(n) - rng.integers(1, 4, n))]
+    replies = np.where(rng.random(n) < 0.05, rng.integers(1, int(n * 1.2), n), replies)
+    replies = np.where(rng.random(n) < 0.85, replies, 0)
+    timestamps = np.sort(rng.integers(0, n * 5, n))
+    return [
+        ChatMessage(id=int(i), user=f"u{u}", text="x", timestamp=int(t), reply_to_id=int(r) or None)
+        for i, u, t, r in zip(ids, rng.integers(0, 9, n), timestamps, replies)
+    ]
+
+
+def _chain_walk_windows(msgs: Sequence[ChatMessage], topic_size: int, max_chain_hops: int) -> List[tuple]:
+    """
+    The original per-response chain walk over a by_id dict, as message indices in message order.
+    """
+    by_id = {m.id: i for i, m in enumerate(msgs)}
+    out = []
+    for i, resp in enumerate(msgs):
+        if resp.reply_to_id is None:
+            continue
+        chain, cur, hops = [i], resp, 0
+        while cur.reply_to_id is not None and hops < max_chain_hops:
+            parent = by_id.get(cur.reply_to_id)
+            if parent is None:
+                break
+            chain.append(parent)
+            cur = msgs[parent]
+            hops += 1
+        chain.reverse()
+        if len(chain) < topic_size:
+            continue
+        window = chain[-topic_size:]
+        if any(msgs[a].timestamp > msgs[b].timestamp for a, b in zip(window, window[1:])):
+            continue
+        if len({msgs[j].id for j in window}) != topic_size:
+            continue
+        out.append(tuple(window))
+    return out
+
+
+def _chain_walk_topics(msgs: Sequence[ChatMessage], windows: List[tuple], non_overlapping: bool) -> List[tuple]:
+    seen, used, out = set(), set(), []
+    for w in windows:
+        sig = tuple(msgs[j].id for j in w)
+        if sig in seen:
+            continue
+        seen.add(sig)
+        if non_overlapping:
+            if any(mid in used for mid in sig):
+                continue
+            used.update(sig)
+        out.append(sig)
+    return out
+
+
+def check_reply_forest(rng: np.random.Generator, seed: int) -> List[str]:
+    """
+    ReplyForest candidate windows and ReplyChainTopicSegmentor topics == the original chain walk.
+    """
+    from topic_segmentor.reply_segmentor import ReplyChainTopicSegmentor, ReplyForest
+
+    failures = []
+    for n in (50, 3000):
+        msgs = _reply_messages(rng, n)
+        forest = ReplyForest.from_messages(msgs)
+        for topic_size in (1, 2, 3, 4, 6):
+            for hops in (0, 1, 3, 50):
+                seg = ReplyChainTopicSegmentor(topic_size, hops)
+                want = _chain_walk_windows(msgs, topic_size, hops)
+                got = [tuple(w) for w in seg._candidate_windows(forest, topic_size).tolist()]
+                if got != want:
+                    failures.append(f"n={n} topic_size={topic_size} hops={hops}: {len(got)} windows, expected {len(want)}")
+                    continue
+                for non_overlapping in (True, False):
+                    seg = ReplyChainTopicSegmentor(topic_size, hops, non_overlapping)
+                    got_topics = [tuple(m.id for m in t) for t in seg.segment(msgs)]
+                    if got_topics != _chain_walk_topics(msgs, want, non_overlapping):
+                        failures.append(f"n={n} topic_size={topic_size} hops={hops} non_overlapping={non_overlapping}: topics differ")
+    return failures
+
+
+CHECKS: Dict[str, Callable[[np.random.Generator, int], List[str]]] = {
+    "json_stream": check_json_stream,
+    "tfidf": check_tfidf,
+    "gbdt": check_gbdt,
+    "reply_forest": check_reply_forest,
+}
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--checks", nargs="+", choices=list(CHECKS), default=list(CHECKS))
+    parser.add_argument("--rounds", type=int, default=2, help="random inputs per check")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    failed = False
+    for name in args.checks:
+        failures: List[str] = []
+        for r in range(args.rounds):
+            seed = args.seed + r
+            failures.extend(f"seed {seed}: {f}" for f in CHECKS[name](np.random.default_rng(seed), seed))
+        failed |= bool(failures)
+        print(f"{'ok' if not failures else 'FAIL':4} {name} ({args.rounds} rounds)")
+        for f in failures:
+            print(f"     {f}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
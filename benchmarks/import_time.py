@@ -0,0 +1,82 @@
+"""
+Import-time benchmark for the topic_segmentor package.
+
+Every case runs in a fresh interpreter, is timed over several runs and checked
+against the heavy modules it must not import. Exits with 1 on a violation or when
+a median exceeds its budget, so it can run as a CI step:
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --runs 10 --budget-scale 2
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import List, Optional, Sequence
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ("numpy", "scipy", "sklearn", "joblib")
+
+# (statement, modules that must stay unimported, budget in ms)
+CASES = [
+    ("import topic_segmentor", HEAVY, 150),
+    ("from topic_segmentor import ChatMessage, TopicSegmentor", HEAVY, 150),
+    ("from topic_segmentor import TimeGapTopicSegmentor", ("scipy", "sklearn", "joblib"), 400),
+    ("from topic_segmentor import ReplyChainTopicSegmentor", ("scipy", "sklearn", "joblib"), 400),
+    ("from topic_segmentor import HybridTimeGapMLTopicSegmentor", ("sklearn", "joblib"), 1500),
+]
+
+_PROBE = """
+import json, sys, time
+t = time.perf_counter()
+exec({stmt!r})
+elapsed = time.perf_counter() - t
+print(json.dumps({{"ms": elapsed * 1000, "loaded": [m for m in {forbidden!r} if m in sys.modules]}}))
+"""
+
+
+def _run_case(stmt: str, forbidden: Sequence[str]) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(stmt=stmt, forbidden=tuple(forbidden))],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="multiply all budgets, e.g. on slow CI")
+    parser.add_argument("--json", dest="json_path", default=None, help="also write results to this file")
+    args = parser.parse_args(argv)
+
+    failed = False
+    results: List[dict] = []
+    for stmt, forbidden, budget_ms in CASES:
+        runs = [_run_case(stmt, forbidden) for _ in range(args.runs)]
+        median = statistics.median(r["ms"] for r in runs)
+        loaded = sorted({m for r in runs for m in r["loaded"]})
+        budget = budget_ms * args.budget_scale
+        ok = not loaded and median <= budget
+        failed |= not ok
+        results.append({"statement": stmt, "median_ms": median, "budget_ms": budget, "forbidden_loaded": loaded, "ok": ok})
+        status = "ok" if ok else "FAIL"
+        extra = f", imported {', '.join(loaded)}" if loaded else ""
+        print(f"{status:4} {median:8.1f} ms (budget {budget:.0f}){extra}  {stmt}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,166 @@
+"""
+Synthetic chats and small stand-in models for the benchmarks.
+
+Messages come in topics: a run of messages drawing words mostly from the topic's own
+slice of the vocabulary, so TF-IDF similarity means something and the stand-in GBDT
+has a signal to learn. Every knob that changes segmentor cost is a ChatSpec field.
+"""
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+_SYLLABLES = ["ка", "ро", "ми", "та", "ле", "но", "су", "ви", "да", "пе", "го", "ры", "ша", "бо", "ze", "lo"]
+
+
+@dataclass(frozen=True)
+class ChatSpec:
+    n_messages: int
+    n_users: int = 50
+    reply_density: float = 0.3  # share of messages replying to an earlier one
+    reply_window: int = 20  # replies point at most this many messages back
+    mean_gap_seconds: float = 45.0  # exponential gap between messages inside a topic
+    long_gap_prob: float = 0.02  # chance of a long pause before a message
+    long_gap_seconds: float = 3 * 3600.0
+    mean_topic_messages: float = 8.0
+    min_words: int = 1
+    max_words: int = 12
+    vocab_size: int = 5000
+    n_topic_words: int = 200  # size of each topic's own vocabulary slice
+    seed: int = 0
+
+    def key(self) -> str:
+        return "-".join(f"{v}" for v in asdict(self).values())
+
+
+def _vocabulary(size: int, rng: np.random.Generator) -> List[str]:
+    words = set()
+    while len(words) < size:
+        n = int(rng.integers(2, 5))
+        words.add("".join(_SYLLABLES[i] for i in rng.integers(0, len(_SYLLABLES), n)))
+    return sorted(words)
+
+
+def iter_raw_messages(spec: ChatSpec, block: int = 100_000) -> Iterator[Dict]:
+    """
+    Raw JSON items (id, user, text, timestamp[, reply_to_id]) in timestamp order,
+    generated block by block so 10^7 messages never sit in memory at once.
+    """
+    for item, _ in _generate(spec, block):
+        yield item
+
+
+def _generate(spec: ChatSpec, block: int = 100_000) -> Iterator[Tuple[Dict, int]]:
+    rng = np.random.default_rng(spec.seed)
+    vocab = _vocabulary(spec.vocab_size, rng)
+    users = [f"user{i}" for i in range(spec.n_users)]
+
+    ts = 1_600_000_000
+    topic = 0
+    for lo in range(0, spec.n_messages, block):
+        n = min(block, spec.n_messages - lo)
+
+        gaps = rng.exponential(spec.mean_gap_seconds, n)
+        long = rng.random(n) < spec.long_gap_prob
+        gaps[long] += rng.exponential(spec.long_gap_seconds, int(long.sum()))
+        stamps = ts + np.cumsum(gaps.astype(np.int64))
+        ts = int(stamps[-1])
+
+        new_topic = long | (rng.random(n) < 1.0 / spec.mean_topic_messages)
+        topics = topic + np.cumsum(new_topic)
+        topic = int(topics[-1])
+
+        user_idx = rng.integers(0, spec.n_users, n)
+        lengths = rng.integers(spec.min_words, spec.max_words + 1, n)
+        # 80% of words from the topic's slice, the rest from the whole vocabulary
+        word_count = int(lengths.sum())
+        own = rng.random(word_count) < 0.8
+        slice_start = (np.repeat(topics, lengths) * 7919) % max(1, spec.vocab_size - spec.n_topic_words)
+        words = np.where(
+            own,
+            slice_start + rng.integers(0, spec.n_topic_words, word_count),
+            rng.zipf(1.3, word_count) % spec.vocab_size,
+        )
+        questions = rng.random(n) < 0.15
+
+        ids = np.arange(lo + 1, lo + n + 1)
+        replies = ids - rng.integers(1, spec.reply_window + 1, n)
+        has_reply = (rng.random(n) < spec.reply_density) & (replies >= 1)
+
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        words_l = words.tolist()
+        for i in range(n):
+            text = " ".join(vocab[w] for w in words_l[offsets[i] : offsets[i + 1]])
+            item = {
+                "id": int(ids[i]),
+                "user": users[user_idx[i]],
+                "text": text + "?" if questions[i] else text,
+                "timestamp": int(stamps[i]),
+            }
+            if has_reply[i]:
+                item["reply_to_id"] = int(replies[i])
+            yield item, int(topics[i])
+
+
+def write_chat_json(path: str, spec: ChatSpec) -> str:
+    """
+    Streams the chat into a JSON array file in the format of raw_data/messages.json.
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for i, item in enumerate(iter_raw_messages(spec)):
+            if i:
+                f.write(",\n")
+            f.write(json.dumps(item, ensure_ascii=False))
+        f.write("\n]\n")
+    os.replace(tmp, path)
+    return path
+
+
+def build_stand_in_models(out_dir: str, topic_size: int = 4, seed: int = 0) -> Tuple[str, str]:
+    """
+    Fits a small TfidfVectorizer + HistGradientBoostingClassifier on synthetic windows
+    (label: all messages from one topic) and saves them as joblib files and as the
+    memory-mapped artifact directory. Returns (tfidf_path, model_path) of the joblib files.
+    """
+    import joblib
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    from topic_segmentor import ChatMessage, WindowTopicModel
+    from topic_segmentor.model_artifacts import export_model_artifacts
+    from topic_segmentor.topic_segmentor import parse_message
+
+    os.makedirs(out_dir, exist_ok=True)
+    tfidf_path = os.path.join(out_dir, "tfidf_feat.joblib")
+    model_path = os.path.join(out_dir, "gbdt_topic_window.joblib")
+    if os.path.exists(tfidf_path) and os.path.exists(model_path):
+        return tfidf_path, model_path
+
+    spec = ChatSpec(n_messages=40_000, mean_topic_messages=6.0, seed=seed)
+    msgs: List[ChatMessage] = []
+    topic_of: List[int] = []
+    for item, topic in _generate(spec):
+        msgs.append(parse_message(item))
+        topic_of.append(topic)
+    rng = np.random.default_rng(seed)
+
+    texts = ["\n".join(f"{m.user}: {m.text}" for m in msgs[i : i + topic_size]) for i in range(0, len(msgs) - topic_size, 2)]
+    tfidf_feat = TfidfVectorizer(lowercase=True, max_features=20_000, ngram_range=(1, 2)).fit(texts)
+
+    starts = rng.integers(0, len(msgs) - topic_size, 20_000)
+    topic_arr = np.asarray(topic_of)
+    y = (topic_arr[starts] == topic_arr[starts + topic_size - 1]).astype(np.int64)
+    model = WindowTopicModel(tfidf_feat=tfidf_feat, gbdt=None, topic_size=topic_size)
+    X = model.featurize_windows(msgs, starts, model._message_cache(msgs))
+    gbdt = HistGradientBoostingClassifier(max_depth=4, learning_rate=0.1, max_iter=60, random_state=seed).fit(X, y)
+
+    joblib.dump(tfidf_feat, tfidf_path)
+    joblib.dump(gbdt, model_path)
+    export_model_artifacts(tfidf_feat, gbdt, os.path.join(out_dir, "window_model"))
+    return tfidf_path, model_path
@@ -7,7 +7,8 @@ from config import config
 from handlers import base, resources
 import atexit
 from utils.utils import load_all_maps, save_all_maps
-from utils.models_manager import chatbot_model
+from utils.models_manager import model_pool, response_batcher
+from utils.inference import inference_executor
 
 TOKEN = config.bot_token.get_secret_value()
 atexit.register(save_all_maps)
@@ -21,12 +22,15 @@ async def main():
     dp = Dispatcher()
     dp.include_routers(base.router, resources.router)
     storage = MemoryStorage()
-    chatbot_model.load_model()
+    # модель по умолчанию грузится в фоне, упоминания до конца загрузки её дождутся
+    model_pool.preload()
 
     await bot.delete_webhook(drop_pending_updates=True)
     try:
         await dp.start_polling(bot)
     finally:
+        response_batcher.stop()
+        inference_executor.shutdown()
         save_all_maps()
         await bot.session.close()
 
@@ -7,6 +7,22 @@ class Settings(BaseSettings):
     resources_dir: str
     models_dir: str
     default_model: str
+    # генерация ответов: потоки и сколько запросов может ждать в очереди
+    inference_workers: int = 1
+    inference_queue_size: int = 8
+    # микробатчинг: сколько запросов в одном generate и сколько мс их ждать
+    inference_batch_size: int = 8
+    inference_batch_wait_ms: int = 10
+    # ответы: лимит символов (в Telegram до 4096) и постепенный вывод правками сообщения
+    reply_max_chars: int = 4000
+    reply_streaming: bool = False
+    reply_stream_interval: float = 1.0
+    # кэш past_key_values общих префиксов промптов, МБ на модель (0 - выключен);
+    # следующие ответы в ветке промпт не продолжают, поэтому по умолчанию выключен
+    prefix_cache_mb: int = 0
+    # пул моделей: сколько последних использованных держать в памяти и сколько МБ весов
+    model_pool_size: int = 2
+    model_pool_mb: int = 2048
 
     model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8')
 
@@ -1,8 +1,10 @@
 from aiogram import Router, F, types
+from aiogram.exceptions import TelegramAPIError
 from aiogram.filters import Command
 from aiogram.types import Message, ReplyKeyboardRemove
 from filters import filters
 from config import config
+import asyncio
 import os
 import re
 import random
@@ -10,7 +12,8 @@ import random
 from transformers import AutoTokenizer, AutoModelForCausalLM
 import torch
 
-from utils.models_manager import chatbot_model
+from utils.models_manager import model_pool, response_batcher, ReplyStreamer
+from utils.inference import inference_executor, InferenceBusy
 
 
 router = Router()
@@ -41,8 +44,8 @@ async def cmd_help(message: Message):
     text += "• Сохранение и удаление датасетов и моделей\n"
     
     # Добавляем информацию о текущей модели, если она загружена
-    current_model = chatbot_model.get_model_info()
-    if current_model:
+    current_model = model_pool.model_name(message.chat.id)
+    if model_pool.is_resident(current_model):
         text += f"\n✅ <b>Текущая модель:</b> <code>{current_model}</code>"
     
     await message.reply(text, parse_mode="HTML")
@@ -56,20 +59,67 @@ async def mention_handler(message: Message):
     # Extract just the text without the mention if needed
     history = [message.text]
 
+    # Context 1 is the message being answered, older messages follow (as context_1 in the training CSV)
     if message.reply_to_message:
         history.append(message.reply_to_message.text)
-        hisotry = reversed(history)
         print(history)
 
-    # Generate response
-    output = chatbot_model.generate_response(history)
+    # Model of this chat (loads in the background if it isn't resident)
+    bot_model = await model_pool.get_for_chat(message.chat.id)
+    if bot_model is None:
+        await message.reply("Модель этого чата не загружается, выберите другую через /switch")
+        return
+
+    # Generate response off the event loop, batched with concurrent mentions
+    sent = None
+    try:
+        if config.reply_streaming:
+            sent, output = await stream_reply(message, bot_model, history)
+        else:
+            output = await response_batcher.generate(bot_model, history)
+    except InferenceBusy:
+        await message.reply("Я сейчас занят другими ответами, напиши чуть позже 🙏")
+        return
     
     # Send response (truncate if too long for Telegram)
-    if len(output) > 4000:
-        output = output[:4000] + "..."
+    if len(output) > config.reply_max_chars:
+        output = output[:config.reply_max_chars] + "..."
     
-    if output:
-        await message.reply(output)
-    else:
+    if not output:
         default_replies = ["Сори, это запретка", "Асуждаю", "Пожалуй, оставлю без ответа", "..."]
-        await message.reply(random.choice(default_replies))
\ No newline at end of file
+        output = random.choice(default_replies)
+    if sent is None:
+        await message.reply(output)
+    elif sent.text != output:
+        await sent.edit_text(output)
+
+
+async def stream_reply(message: Message, bot_model, history):
+    """
+    Генерирует ответ без батчинга и показывает его по мере готовности: первый кусок
+    уходит ответом на сообщение, дальше оно правится не чаще раза в reply_stream_interval
+    секунд (чаще Telegram ограничивает правки). Возвращает (отправленное сообщение или None, ответ).
+    """
+    loop = asyncio.get_running_loop()
+    partial = [""]
+    streamer = ReplyStreamer(
+        bot_model.tokenizer,
+        lambda text: loop.call_soon_threadsafe(partial.__setitem__, 0, text),
+    )
+    task = asyncio.ensure_future(
+        inference_executor.run(bot_model.generate_response, history, streamer=streamer)
+    )
+    sent = None
+    while not task.done():
+        await asyncio.wait({task}, timeout=config.reply_stream_interval)
+        text = partial[0]
+        if task.done() or not text or (sent is not None and sent.text == text):
+            continue
+        try:
+            if sent is None:
+                sent = await message.reply(text)
+            else:
+                sent = await sent.edit_text(text)
+        except TelegramAPIError as e:
+            print(f"Ошибка при обновлении ответа: {e}")
+    return sent, task.result()
\ No newline at end of file
@@ -9,7 +9,7 @@ import atexit
 import utils.utils as utils
 import os
 import re
-from utils.models_manager import chatbot_model
+from utils.models_manager import model_pool
 
 router = Router()
 
@@ -47,10 +47,11 @@ async def cmd_switch(message: Message, state: FSMContext):
     
     # Создаем клавиатуру с кнопками для каждой модели
     keyboard = InlineKeyboardMarkup(inline_keyboard=[])
+    current_model = model_pool.model_name(message.chat.id)
     
     for model_name in utils.models_map.keys():
         # Добавляем эмодзи текущей модели, если она загружена
-        prefix = "✅ " if (chatbot_model.current_model_name == model_name and chatbot_model.model is not None) else ""
+        prefix = "✅ " if (current_model == model_name and model_pool.is_resident(model_name)) else ""
         keyboard.inline_keyboard.append([
             InlineKeyboardButton(
                 text=f"{prefix}{model_name}", 
@@ -65,8 +66,8 @@ async def cmd_switch(message: Message, state: FSMContext):
     
     # Получаем информацию о текущей модели
     current_model_info = ""
-    if chatbot_model.current_model_name:
-        current_model_info = f"\n\n📋 Текущая модель: <b>{chatbot_model.current_model_name}</b>"
+    if current_model:
+        current_model_info = f"\n\n📋 Текущая модель: <b>{current_model}</b>"
     
     await message.reply(
         f"🤖 Выберите модель для загрузки:{current_model_info}",
@@ -97,8 +98,14 @@ async def process_model_switch(callback: types.CallbackQuery, state: FSMContext)
     model_name = model_action
     
     try:
-        # Загружаем модель через chatbot_model
-        success = chatbot_model.load_model(model_name)
+        # Модель грузится в фоне из пула, бот в это время отвечает остальным чатам
+        if not model_pool.is_resident(model_name):
+            await callback.message.edit_text(
+                f"⏳ Загружаю модель <b>{model_name}</b>...",
+                parse_mode="HTML",
+                reply_markup=None
+            )
+        success = await model_pool.switch(callback.message.chat.id, model_name)
         
         if success:
             response = f"✅ Модель успешно переключена на <b>{model_name}</b>"
@@ -126,9 +133,9 @@ async def process_model_switch(callback: types.CallbackQuery, state: FSMContext)
 @router.message(Command("model_info"))
 async def cmd_model_info(message: Message):
     """Команда для получения информации о текущей модели"""
-    model_info = chatbot_model.get_model_info()
+    model_info = model_pool.model_name(message.chat.id)
     
-    if model_info:
+    if model_pool.is_resident(model_info):
         response = (
             f"🤖 <b>Информация о модели:</b>\n\n"
             f"✅ Модель загружена\n"
@@ -137,8 +144,9 @@ async def cmd_model_info(message: Message):
     else:
         response = (
             f"🤖 <b>Информация о модели:</b>\n\n"
-            f"❌ Модель <b>не</b> загружена\n"
+            f"❌ Модель <b>{model_info}</b> <b>не</b> загружена, загрузится при первом упоминании\n"
         )
+    response += f"💾 В памяти: {', '.join(model_pool.resident()) or 'нет моделей'}\n"
     
     await message.reply(response, parse_mode="HTML")
 
@@ -173,10 +181,11 @@ async def show_models_files(callback: types.CallbackQuery):
         await callback.answer()
         return
     
-    # Добавляем информацию о текущей загруженной модели
+    # Добавляем информацию о текущей модели чата
+    current_model = model_pool.model_name(callback.message.chat.id)
     current_model_info = ""
-    if chatbot_model.current_model_name:
-        current_model_info = f"\n🔹 <b>Текущая модель: {chatbot_model.current_model_name}</b>\n\n"
+    if current_model:
+        current_model_info = f"\n🔹 <b>Текущая модель: {current_model}</b>\n\n"
     
     response = f"🤖 Сохраненные модели:{current_model_info}"
     
@@ -184,7 +193,7 @@ async def show_models_files(callback: types.CallbackQuery):
         if os.path.exists(path):
             file_size = os.path.getsize(path)
             # Добавляем маркер для текущей модели
-            current_marker = "✅ " if name == chatbot_model.current_model_name else ""
+            current_marker = "✅ " if name == current_model else ""
             response += f"{i}. {current_marker}{name}\n"
             response += f"   🤖 {os.path.basename(path)}\n"
             response += f"   📏 {file_size / 1024:.1f} KB\n\n"
@@ -237,20 +246,24 @@ async def show_models_for_deletion(callback: types.CallbackQuery):
         return
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[])
+    current_model = model_pool.model_name(callback.message.chat.id)
     
     for name in utils.models_map.keys():
-        # Не показываем кнопку удаления для текущей модели, чтобы избежать ошибок
-        if name != chatbot_model.current_model_name:
+        # Не показываем кнопку удаления для текущей модели и модели по умолчанию
+        if name not in (current_model, model_pool.default_model):
             keyboard.inline_keyboard.append([
                 InlineKeyboardButton(text=f"❌ {name}", callback_data=f"delete_model_{name}")
             ])
     
     # Если после фильтрации кнопок не осталось
     if not keyboard.inline_keyboard:
-        if chatbot_model.current_model_name:
+        if current_model:
+            default_info = ""
+            if model_pool.default_model in utils.models_map and model_pool.default_model != current_model:
+                default_info = f", а '{model_pool.default_model}' - модель по умолчанию"
             await callback.message.edit_text(
-                f"⚠️ Невозможно удалить модели, так как модель '{chatbot_model.current_model_name}' "
-                f"сейчас загружена и используется.\n\n"
+                f"⚠️ Невозможно удалить модели, так как модель '{current_model}' "
+                f"сейчас загружена и используется{default_info}.\n\n"
                 f"Сначала переключитесь на другую модель с помощью /switch",
                 reply_markup=None
             )
@@ -262,8 +275,10 @@ async def show_models_for_deletion(callback: types.CallbackQuery):
     else:
         # Добавляем предупреждение, если есть загруженная модель
         warning = ""
-        if chatbot_model.current_model_name:
-            warning = f"\n\n⚠️ <b>Текущая модель '{chatbot_model.current_model_name}' не будет отображена для удаления.</b>"
+        if current_model:
+            warning = f"\n\n⚠️ <b>Текущая модель '{current_model}' не будет отображена для удаления.</b>"
+        if model_pool.default_model in utils.models_map and model_pool.default_model != current_model:
+            warning += f"\n⚠️ <b>Модель по умолчанию '{model_pool.default_model}' удалить нельзя.</b>"
         
         await callback.message.edit_text(
             f"🗑️ Выберите модель для удаления:{warning}",
@@ -314,8 +329,17 @@ async def process_model_delete(callback: types.CallbackQuery):
         await callback.answer()
         return
     
+    # Модель по умолчанию нужна всем чатам, которые не выбрали свою
+    if filename == model_pool.default_model:
+        await callback.message.edit_text(
+            f"❌ Невозможно удалить модель '{filename}', так как это модель по умолчанию.",
+            reply_markup=None
+        )
+        await callback.answer()
+        return
+
     # Проверяем, не пытаемся ли удалить текущую модель
-    if filename == chatbot_model.current_model_name:
+    if filename == model_pool.model_name(callback.message.chat.id):
         await callback.message.edit_text(
             f"❌ Невозможно удалить модель '{filename}', так как она сейчас загружена.\n\n"
             f"Сначала переключитесь на другую модель с помощью /switch",
@@ -331,6 +355,8 @@ async def process_model_delete(callback: types.CallbackQuery):
             os.remove(file_path)
         
         del utils.models_map[filename]
+        # Выгружаем модель, чаты с ней возвращаются к модели по умолчанию
+        model_pool.forget(filename)
         
         await callback.message.edit_text(
             f"✅ Модель '{filename}' успешно удалена.",
@@ -560,6 +586,8 @@ async def get_model_filename(message: Message, state: FSMContext):
             utils.models_map = {}
         
         utils.models_map[user_filename] = final_path
+        # Пул мог запомнить неудачную загрузку прежнего файла с этим именем
+        model_pool.forget(user_filename)
         
         # Получаем информацию о файле
         file_size = os.path.getsize(temp_path)
@@ -0,0 +1,64 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import config
+
+
+class InferenceBusy(Exception):
+    """Очередь генерации заполнена, запрос не принят"""
+
+
+class InferenceExecutor:
+    """
+    Выполняет генерацию вне event loop: в пуле потоков (модель общая, torch отпускает GIL)
+    с ограниченной очередью. Пока идёт генерация, диспетчер продолжает обслуживать
+    остальные чаты и команды.
+
+    В работе или в очереди одновременно не больше workers + queue_size запросов;
+    сверх этого run() сразу бросает InferenceBusy, чтобы ответить "занят", а не копить
+    очередь на минуты. Запрос считается до конца генерации, даже если ожидавший его
+    обработчик отменён: поток при этом всё равно занят.
+    """
+
+    def __init__(self, workers=1, queue_size=8):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def is_full(self):
+        return self._pending >= self.capacity
+
+    async def run(self, fn, *args, **kwargs):
+        with self._lock:
+            if self.is_full():
+                raise InferenceBusy()
+            self._pending += 1
+        try:
+            future = self._pool.submit(functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            self._done(None)
+            raise
+        # счётчик уменьшается, когда закончился сам вызов (в потоке), а не ожидание
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def _done(self, _):
+        with self._lock:
+            self._pending -= 1
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+inference_executor = InferenceExecutor(
+    workers=config.inference_workers,
+    queue_size=config.inference_queue_size,
+)
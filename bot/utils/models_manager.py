@@ -1,18 +1,126 @@
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, StoppingCriteria, StoppingCriteriaList, TextStreamer
 import torch
+import asyncio
+import copy
+import itertools
 import os
 import re
+import threading
+from collections import OrderedDict
 from utils.utils import models_map
+from utils.inference import inference_executor, InferenceBusy
 from config import config
 
 
+# Начало следующего хода диалога: дальше модель пишет уже не ответ ассистента
+TURN_MARKERS = ("Ассистент:", "Контекст")
+# Нижняя оценка символов на токен ruGPT-3 (в среднем их около четырёх): бюджет токенов
+# почти никогда не обрезает ответ раньше лимита символов, точно его держит ReplyStoppingCriteria
+MIN_CHARS_PER_TOKEN = 2
+
+
+def _cut_reply(text, max_chars):
+    """Обрезает ответ по первому маркеру хода и по лимиту символов"""
+    for marker in TURN_MARKERS:
+        pos = text.find(marker)
+        if pos != -1:
+            text = text[:pos]
+    return text[:max_chars]
+
+
+class ReplyStoppingCriteria(StoppingCriteria):
+    """Останавливает строку батча, как только в ответе появился маркер хода или набралось max_chars символов"""
+
+    def __init__(self, tokenizer, prompt_length, max_chars):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.max_chars = max_chars
+
+    def __call__(self, input_ids, scores, **kwargs):
+        texts = self.tokenizer.batch_decode(input_ids[:, self.prompt_length:], skip_special_tokens=True)
+        done = [len(text) >= self.max_chars or any(m in text for m in TURN_MARKERS) for text in texts]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+class ReplyStreamer(TextStreamer):
+    """Передаёт в on_text уже очищенный ответ целиком каждый раз, когда декодирован новый кусок"""
+
+    def __init__(self, tokenizer, on_text, max_chars=None):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        self.on_text = on_text
+        self.max_chars = max_chars or config.reply_max_chars
+        self.text = ""
+
+    def on_finalized_text(self, text, stream_end=False):
+        self.text += text
+        self.on_text(_cut_reply(self.text, self.max_chars).strip())
+
+
+class PrefixCache:
+    """
+    LRU-кэш past_key_values промптов одной модели с лимитом памяти. Для нового промпта
+    берётся кэш с самым длинным общим префиксом токенов (не короче min_prefix), и модель
+    считает только оставшиеся токены. Промпт начинается с нового сообщения, поэтому
+    совпадают только повторные промпты и общие начала сообщений (упоминание бота);
+    ответы в одной ветке кэшированный промпт не продолжают.
+    """
+
+    def __init__(self, max_bytes, min_prefix=8):
+        self.max_bytes = max_bytes
+        self.min_prefix = min_prefix
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, input_ids):
+        """(копия кэша, обрезанная до общего префикса, его длина) или (None, 0)"""
+        best, best_len = None, 0
+        with self._lock:
+            for key, (ids, cache, _) in self._entries.items():
+                n = min(len(ids), len(input_ids) - 1)
+                if n <= best_len:
+                    continue
+                diff = (ids[:n] != input_ids[:n]).nonzero()
+                common = int(diff[0]) if len(diff) else n
+                if common > best_len:
+                    best, best_len = key, common
+            if best is None or best_len < self.min_prefix:
+                return None, 0
+            self._entries.move_to_end(best)
+            cache = copy.deepcopy(self._entries[best][1])
+        cache.crop(best_len)
+        return cache, best_len
+
+    def put(self, input_ids, cache, nbytes):
+        if nbytes > self.max_bytes:
+            return
+        key = tuple(input_ids.tolist())
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[2]
+            self._entries[key] = (input_ids, cache, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                self.nbytes -= self._entries.popitem(last=False)[1][2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
 class ChatBotModel:
-    def __init__(self, models_dir=None):
+    def __init__(self, models_dir=None, tokenizer=None):
         self.models_dir = models_dir or config.models_dir
-        self.tokenizer = None
+        self.tokenizer = tokenizer
         self.model = None
         self.current_model_name = None
-        self._init_tokenizer()
+        self.prefix_cache = PrefixCache(config.prefix_cache_mb * 1024 * 1024)
+        if self.tokenizer is None:
+            self._init_tokenizer()
     
     def _init_tokenizer(self):
         try:
@@ -22,6 +130,8 @@ class ChatBotModel:
             # Устанавливаем pad token как eos token, если его нет
             if self.tokenizer.pad_token is None:
                 self.tokenizer.pad_token = self.tokenizer.eos_token
+            # В батче промпты выравниваются слева, чтобы генерация у всех шла с последней позиции
+            self.tokenizer.padding_side = "left"
         except Exception as e:
             print(f"Ошибка при загрузке токенизатора: {e}")
             raise
@@ -45,6 +155,7 @@ class ChatBotModel:
                                   weights_only=False)
             self.model.eval()  # Переводим в режим оценки
             self.current_model_name = name
+            self.prefix_cache.clear()
             
             print(f"Модель '{name}' успешно загружена")
             return True
@@ -53,23 +164,60 @@ class ChatBotModel:
             print(f"Ошибка при загрузке модели: {e}")
             self.model = None
             self.current_model_name = None
+            self.prefix_cache.clear()
             return False
     
-    def generate_response(self, history, max_length=1000, temperature=0.9, 
-                         top_k=50, top_p=0.95, no_repeat_ngram_size=2,
-                         repetition_penalty=1.1, min_length=10):
+    def _build_prompt(self, history):
+        prompt = f"Контекст 1: {history[0].strip()}"
+        if len(history) > 1:
+            prompt += f"\nКонтекст 2: {history[1].strip()}"
+        return prompt + "\nАссистент:"
+
+    def generate_response(self, history, **kwargs):
+        return self.generate_responses([history], **kwargs)[0]
+
+    def _token_budget(self, max_chars, prompt_length):
+        budget = -(-max_chars // MIN_CHARS_PER_TOKEN)
+        n_positions = getattr(self.model.config, "n_positions", None)
+        if n_positions:
+            budget = min(budget, n_positions - prompt_length)
+        return max(budget, 1)
+
+    def _kv_bytes(self, n_tokens):
+        """Сколько памяти занимают ключи и значения n_tokens токенов во всех слоях"""
+        cfg = self.model.config
+        itemsize = next(self.model.parameters()).element_size()
+        return 2 * cfg.num_hidden_layers * cfg.hidden_size * itemsize * n_tokens
+
+    def generate_responses(self, histories, max_new_tokens=None, max_chars=None, temperature=0.9,
+                           top_k=50, top_p=0.95, no_repeat_ngram_size=2,
+                           repetition_penalty=1.1, min_length=10, streamer=None):
+        """
+        Ответы на несколько историй за один вызов generate (промпты выровнены слева).
+        Длина ответа ограничена max_chars символов (по умолчанию config.reply_max_chars),
+        max_new_tokens по умолчанию выводится из него. streamer - только для одной истории.
+        Одиночные запросы используют prefix_cache: общий с прошлыми промптами префикс не пересчитывается.
+        """
         if self.model is None:
-            return "Модель не загружена. Пожалуйста, загрузите модель с помощью load_model()."
+            return ["Модель не загружена. Пожалуйста, загрузите модель с помощью load_model()."] * len(histories)
         
         try:
-            prompt = f"Контекст 1: {history[0].strip()}{"\nКонтекст 2: {history[1].strip()" if len(history) > 1 else ""}\nАссистент:"
+            prompts = [self._build_prompt(history) for history in histories]
 
             tokenized = self.tokenizer(
-                prompt, 
+                prompts, 
                 return_tensors="pt",
                 truncation=True,
                 padding=True
             )
+            max_chars = max_chars or config.reply_max_chars
+            prompt_length = tokenized.input_ids.shape[1]
+            if max_new_tokens is None:
+                max_new_tokens = self._token_budget(max_chars, prompt_length)
+            use_prefix_cache = len(histories) == 1 and self.prefix_cache.max_bytes > 0
+            past_key_values = None
+            if use_prefix_cache:
+                past_key_values, _ = self.prefix_cache.lookup(tokenized.input_ids[0])
             
             # Генерация ответа
             with torch.no_grad():
@@ -77,7 +225,7 @@ class ChatBotModel:
                     input_ids=tokenized.input_ids,
                     attention_mask=tokenized.attention_mask,
                     num_return_sequences=1,
-                    max_length=max_length,
+                    max_new_tokens=max_new_tokens,
                     min_length=min_length,
                     temperature=temperature,
                     top_k=top_k,
@@ -88,23 +236,45 @@ class ChatBotModel:
                     no_repeat_ngram_size=no_repeat_ngram_size,
                     do_sample=True,
                     early_stopping=True,
+                    stopping_criteria=StoppingCriteriaList([
+                        ReplyStoppingCriteria(self.tokenizer, prompt_length, max_chars)
+                    ]),
+                    streamer=streamer,
+                    past_key_values=past_key_values,
+                    return_dict_in_generate=True,
                 )
             
-            # Декодирование ответа
-            response = self.tokenizer.decode(
-                output[0], 
+            # Декодирование ответа (паддинг слева убирается вместе со спецтокенами)
+            responses = self.tokenizer.batch_decode(
+                output.sequences, 
                 skip_special_tokens=True
             )
             
             # Очистка ответа
             # response = self._clean_response(response, text)
-            response = self._extract_assistant_response(response, prompt)
-            
-            return response.strip()
+            replies = [
+                _cut_reply(self._extract_assistant_response(response, prompt), max_chars).strip()
+                for response, prompt in zip(responses, prompts)
+            ]
             
         except Exception as e:
             print(f"Ошибка при генерации ответа: {e}")
-            return ""
+            return [""] * len(histories)
+
+        if use_prefix_cache:
+            self._cache_prompt(tokenized.input_ids[0], output.past_key_values, prompt_length)
+        return replies
+
+    def _cache_prompt(self, input_ids, past_key_values, prompt_length):
+        """Кладёт в prefix_cache часть кэша генерации, относящуюся к промпту"""
+        # старые версии transformers отдают кэш кортежем, обрезать его нечем
+        if not hasattr(past_key_values, "crop"):
+            return
+        try:
+            past_key_values.crop(prompt_length)
+            self.prefix_cache.put(input_ids, past_key_values, self._kv_bytes(prompt_length))
+        except Exception as e:
+            print(f"Ошибка при сохранении кэша промпта: {e}")
     
     def _extract_assistant_response(self, full_response, prompt):
         """Извлекает только ответ ассистента из полного текста"""
@@ -134,12 +304,235 @@ class ChatBotModel:
         """Выгрузка модели из памяти"""
         self.model = None
         self.current_model_name = None
+        self.prefix_cache.clear()
         torch.cuda.empty_cache() if torch.cuda.is_available() else None
         print("Модель выгружена из памяти")
 
     def get_model_info(self):
         return self.current_model_name
-    
+
+    def model_bytes(self):
+        """Память весов и буферов загруженной модели"""
+        if self.model is None:
+            return 0
+        tensors = itertools.chain(self.model.parameters(), self.model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelPool:
+    """
+    Несколько моделей в памяти одновременно: до max_models последних использованных
+    и не больше max_mb МБ весов, давно не использованные выгружаются (последняя
+    загруженная остаётся всегда). Каждый чат отвечает своей моделью, по умолчанию
+    default_model, /switch меняет её только для этого чата.
+
+    Модели грузятся в фоновом потоке, event loop в это время обслуживает остальные
+    чаты; одновременные запросы одной модели ждут одну загрузку. Модель, которая
+    не загрузилась, запоминается и не грузится снова, пока её файл не заменят
+    (или до /switch на неё). Загрузка модели, удалённой за это время, отбрасывается.
+    """
+
+    def __init__(self, max_models=2, max_mb=2048, default_model=config.default_model):
+        self.max_models = max_models
+        self.max_bytes = max_mb * 1024 * 1024
+        self.default_model = default_model
+        self.chat_models = {}
+        self._resident = OrderedDict()  # имя -> (ChatBotModel, байты)
+        self._loading = {}
+        self._failed = {}  # имя -> файл, который не загрузился (путь, mtime, размер)
+        self._tokenizer = None
+
+    def model_name(self, chat_id):
+        return self.chat_models.get(chat_id, self.default_model)
+
+    def resident(self):
+        """Имена загруженных моделей, от давно использованной к последней"""
+        return list(self._resident)
+
+    def is_resident(self, name):
+        return name in self._resident
+
+    async def get(self, name):
+        """ChatBotModel с загруженной моделью name или None, если загрузить не удалось"""
+        if name in self._resident:
+            self._resident.move_to_end(name)
+            return self._resident[name][0]
+        if name in self._failed:
+            if self._failed[name] == self._file_stamp(name):
+                return None
+            # файл с тех пор загрузили заново или заменили
+            del self._failed[name]
+        task = self._loading.get(name)
+        if task is None:
+            task = asyncio.ensure_future(self._load(name))
+            self._loading[name] = task
+            task.add_done_callback(lambda t: self._loading.pop(name) if self._loading.get(name) is t else None)
+        # отмена одного ожидающего не должна отменять загрузку для остальных
+        return await asyncio.shield(task)
+
+    async def get_for_chat(self, chat_id):
+        return await self.get(self.model_name(chat_id))
+
+    async def switch(self, chat_id, name):
+        # явный выбор модели - повод попробовать загрузить её ещё раз
+        self._failed.pop(name, None)
+        if await self.get(name) is None:
+            return False
+        self.chat_models[chat_id] = name
+        return True
+
+    def preload(self, name=None):
+        return asyncio.ensure_future(self.get(name or self.default_model))
+
+    def forget(self, name):
+        """Выгружает модель и возвращает чаты, которые ей отвечали, к модели по умолчанию"""
+        self._unload(name)
+        self._failed.pop(name, None)
+        # загрузка, которая сейчас идёт, не вернёт модель в пул
+        self._loading.pop(name, None)
+        for chat_id in [c for c, n in self.chat_models.items() if n == name]:
+            del self.chat_models[chat_id]
+
+    async def _load(self, name):
+        loop = asyncio.get_running_loop()
+        stamp = self._file_stamp(name)
+        bot_model = await loop.run_in_executor(None, self._load_sync, name)
+        if self._loading.get(name) is not asyncio.current_task() or name not in models_map:
+            # модель удалили, пока она грузилась
+            return None
+        if bot_model is None:
+            self._failed[name] = stamp
+            return None
+        self._resident[name] = (bot_model, bot_model.model_bytes())
+        self._evict()
+        return bot_model
+
+    def _file_stamp(self, name):
+        if name not in models_map:
+            return None
+        path = os.path.join(config.models_dir, os.path.basename(models_map[name]))
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return path, st.st_mtime_ns, st.st_size
+
+    def _load_sync(self, name):
+        bot_model = ChatBotModel(tokenizer=self._tokenizer)
+        self._tokenizer = bot_model.tokenizer
+        return bot_model if bot_model.load_model(name) else None
+
+    def _evict(self):
+        while len(self._resident) > 1 and (
+            len(self._resident) > self.max_models
+            or sum(nbytes for _, nbytes in self._resident.values()) > self.max_bytes
+        ):
+            self._unload(next(iter(self._resident)))
+
+    def _unload(self, name):
+        entry = self._resident.pop(name, None)
+        if entry is None:
+            return
+        # ссылки убираются, а не обнуляются: генерация, которая уже идёт, доработает,
+        # память освободится после неё
+        entry[0].prefix_cache.clear()
+        print(f"Модель '{name}' выгружена из памяти")
+
+
+
+class ResponseBatcher:
+    """
+    Микробатчинг запросов к моделям. Упоминания, пришедшие почти одновременно из разных
+    чатов, копятся до batch_wait_ms (или до batch_size штук) и уходят в модель одним
+    вызовом generate_responses; каждый обработчик получает свой ответ. В батч попадают
+    запросы к одной модели, запросы к другим ждут следующего батча.
+
+    Пока все потоки inference_executor заняты, новые запросы ждут в очереди и попадают
+    в следующий батч. Очередь вместе с отложенными запросами к другим моделям ограничена
+    queue_size, при переполнении generate() бросает InferenceBusy.
+    """
+
+    def __init__(self, batch_size=8, batch_wait_ms=10, queue_size=8, executor=inference_executor):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.queue_size = queue_size
+        self.executor = executor
+        self._queue = None
+        self._deferred = []
+        self._worker = None
+        self._batches = set()
+
+    async def generate(self, model, history):
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        # отложенные запросы уже вышли из очереди, но всё ещё ждут своего батча
+        if self._queue.qsize() + len(self._deferred) >= self.queue_size:
+            raise InferenceBusy()
+        try:
+            self._queue.put_nowait((model, history, future))
+        except asyncio.QueueFull:
+            raise InferenceBusy()
+        return await future
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._deferred = []
+            self._worker = asyncio.create_task(self._collect())
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.executor.workers)
+        while True:
+            # новый батч собирается только когда есть свободный поток
+            await slots.acquire()
+            first = self._deferred.pop(0) if self._deferred else await self._queue.get()
+            model = first[0]
+            batch, rest = [first], []
+            for item in self._deferred:
+                (batch if item[0] is model and len(batch) < self.batch_size else rest).append(item)
+            self._deferred = rest
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                (batch if item[0] is model else self._deferred).append(item)
+            task = asyncio.create_task(self._run(model, batch, slots))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run(self, model, batch, slots):
+        try:
+            responses = await self.executor.run(model.generate_responses, [history for _, history, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, _, future), response in zip(batch, responses):
+                if not future.done():
+                    future.set_result(response)
+        finally:
+            slots.release()
+
+    def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+        for task in self._batches:
+            task.cancel()
 
 
-chatbot_model = ChatBotModel()
+model_pool = ModelPool(
+    max_models=config.model_pool_size,
+    max_mb=config.model_pool_mb,
+)
+response_batcher = ResponseBatcher(
+    batch_size=config.inference_batch_size,
+    batch_wait_ms=config.inference_batch_wait_ms,
+    queue_size=config.inference_queue_size,
+)
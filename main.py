@@ -1,4 +1,4 @@
-from topic_segmentor import HybridTimeGapMLTopicSegmentor, export_topics_to_csv
+from topic_segmentor import HybridTimeGapMLTopicSegmentor, MessageStore, export_topics_to_csv
 
 seg = HybridTimeGapMLTopicSegmentor(
     max_gap_seconds=300,
@@ -8,7 +8,8 @@ seg = HybridTimeGapMLTopicSegmentor(
     model_path="models/gbdt_topic_window.joblib",
 )
 
-topics = seg.get_topics("raw_data/messages.json")
-print("Obtained topics:", len(topics))
-
-export_topics_to_csv("hybrid_sns.csv", topics)
\ No newline at end of file
+# messages are loaded sorted by timestamp (the export may be shuffled), segmentation and
+# export run as one stream, topics are never all held in memory
+messages = MessageStore.load("raw_data/messages.json")
+n_topics = export_topics_to_csv("hybrid_sns.csv", seg.iter_topics(messages), topic_size=seg.get_topic_size())
+print("Obtained topics:", n_topics)
\ No newline at end of file
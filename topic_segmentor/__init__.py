@@ -1,16 +1,48 @@
+from importlib import import_module
+
 from .topic_segmentor import TopicSegmentor, ChatMessage, Topic
-from .time_gap_segmentor import TimeGapTopicSegmentor
-from .export_topics_to_csv import export_topics_to_csv
-from .reply_segmentor import ReplyChainTopicSegmentor
-from .window_topic_model import WindowTopicModel
-from .hybrid_timegap_topic_segmentor import HybridTimeGapMLTopicSegmentor
+
+# everything else is imported on first access (PEP 562), so e.g. ChatMessage
+# does not pull in numpy, and only the ML segmentors pull in scipy / sklearn / joblib
+_LAZY = {
+    "MessageStore": ".message_store",
+    "MessageView": ".message_store",
+    "OutOfOrderError": ".message_stream",
+    "TimeGapTopicSegmentor": ".time_gap_segmentor",
+    "export_topics_to_csv": ".export_topics_to_csv",
+    "export_topics_to_parquet": ".export_topics_to_csv",
+    "ReplyChainTopicSegmentor": ".reply_segmentor",
+    "WindowTopicModel": ".window_topic_model",
+    "HybridTimeGapMLTopicSegmentor": ".hybrid_timegap_topic_segmentor",
+    "SweepResult": ".hybrid_timegap_topic_segmentor",
+    "OnlineHybridSegmentor": ".online_segmentor",
+}
 
 __all__ = ["TopicSegmentor",
            "ChatMessage",
            "Topic",
+           "MessageStore",
+           "MessageView",
+           "OutOfOrderError",
            "TimeGapTopicSegmentor",
            "export_topics_to_csv",
+           "export_topics_to_parquet",
            "ReplyChainTopicSegmentor",
            "HybridTimeGapMLTopicSegmentor",
+           "SweepResult",
+           "OnlineHybridSegmentor",
            "WindowTopicModel"
-       ]
\ No newline at end of file
+       ]
+
+
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
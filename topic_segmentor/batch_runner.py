@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from .export_topics_to_csv import export_topics_to_csv
+from .hybrid_timegap_topic_segmentor import HybridTimeGapMLTopicSegmentor
+from .message_store import MessageStore
+
+# one segmentor (and one copy of the joblib models) per worker process
+_SEGMENTOR: Optional[HybridTimeGapMLTopicSegmentor] = None
+
+
+@dataclass
+class ChatResult:
+    path: str
+    output: Optional[str]
+    messages: int = 0
+    topics: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+def _init_worker(segmentor_kwargs: Dict[str, Any]) -> None:
+    global _SEGMENTOR
+    _SEGMENTOR = HybridTimeGapMLTopicSegmentor(**segmentor_kwargs)
+
+
+def _segment_chat(path: str, output: str) -> ChatResult:
+    start = time.perf_counter()
+    try:
+        messages = MessageStore.load(path)
+        # topics go straight from the segmentor generator into the file
+        topics = export_topics_to_csv(
+            output, _SEGMENTOR.iter_topics(messages), topic_size=_SEGMENTOR.get_topic_size()
+        )
+        return ChatResult(
+            path=path,
+            output=output,
+            messages=len(messages),
+            topics=topics,
+            seconds=time.perf_counter() - start,
+        )
+    except Exception as e:
+        return ChatResult(
+            path=path,
+            output=None,
+            seconds=time.perf_counter() - start,
+            error=f"{type(e).__name__}: {e}",
+        )
+
+
+def expand_inputs(inputs: Sequence[str]) -> List[str]:
+    """
+    Directories -> their *.json files, anything else is treated as a glob pattern.
+    """
+    paths: List[str] = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(glob.glob(os.path.join(item, "*.json"))))
+        else:
+            paths.extend(sorted(glob.glob(item)))
+    return list(dict.fromkeys(paths))
+
+
+def _output_paths(paths: Sequence[str], out_dir: str) -> List[str]:
+    used: Dict[str, int] = {}
+    out = []
+    for p in paths:
+        stem = os.path.splitext(os.path.basename(p))[0]
+        n = used.get(stem, 0)
+        used[stem] = n + 1
+        name = stem if n == 0 else f"{stem}_{n}"
+        out.append(os.path.join(out_dir, f"{name}.csv"))
+    return out
+
+
+def run_batch(
+    paths: Sequence[str],
+    out_dir: str,
+    workers: Optional[int] = None,
+    verbose: bool = True,
+    **segmentor_kwargs: Any,
+) -> List[ChatResult]:
+    """
+    Segments every chat file with HybridTimeGapMLTopicSegmentor(**segmentor_kwargs)
+    across a process pool and writes one CSV per chat into out_dir.
+    A failing chat is reported in its ChatResult and does not stop the batch.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    outputs = _output_paths(paths, out_dir)
+    # largest chats first, so one big file does not end up last on a single worker
+    jobs = sorted(zip(paths, outputs), key=lambda j: os.path.getsize(j[0]), reverse=True)
+
+    results: List[ChatResult] = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(segmentor_kwargs,),
+    ) as pool:
+        futures = {pool.submit(_segment_chat, p, o): (p, o) for p, o in jobs}
+        for fut in as_completed(futures):
+            path, output = futures[fut]
+            try:
+                res = fut.result()
+            except Exception as e:  # worker died, e.g. models failed to load
+                res = ChatResult(path=path, output=None, error=f"{type(e).__name__}: {e}")
+            results.append(res)
+            if verbose:
+                if res.error:
+                    print(f"FAILED {res.path}: {res.error}")
+                else:
+                    print(f"{res.path}: {res.messages} messages -> {res.topics} topics in {res.seconds:.1f}s")
+    elapsed = time.perf_counter() - start
+
+    if verbose:
+        done = [r for r in results if r.error is None]
+        total_msgs = sum(r.messages for r in done)
+        print(
+            f"Chats: {len(done)}/{len(results)} ok, {total_msgs} messages in {elapsed:.1f}s "
+            f"({total_msgs / max(elapsed, 1e-9):.0f} msgs/s, {len(results) / max(elapsed, 1e-9):.2f} chats/s)"
+        )
+    return results
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Segment many chat exports in parallel.")
+    parser.add_argument("inputs", nargs="+", help="chat JSON files, directories or glob patterns")
+    parser.add_argument("-o", "--out-dir", default="topics", help="directory for the CSV files")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--max-gap-seconds", type=int, default=300)
+    parser.add_argument("--topic-size", type=int, default=4)
+    parser.add_argument("--threshold", type=float, default=0.7)
+    parser.add_argument("--tfidf-path", default="models/tfidf_feat.joblib")
+    parser.add_argument("--model-path", default="models/gbdt_topic_window.joblib")
+    args = parser.parse_args(argv)
+
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        parser.error("no chat files found")
+
+    results = run_batch(
+        paths,
+        args.out_dir,
+        workers=args.workers,
+        max_gap_seconds=args.max_gap_seconds,
+        topic_size=args.topic_size,
+        threshold=args.threshold,
+        tfidf_path=args.tfidf_path,
+        model_path=args.model_path,
+    )
+    return 1 if any(r.error for r in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
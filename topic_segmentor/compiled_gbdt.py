@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+_ARRAYS = ("feature", "threshold", "missing_left", "left", "right", "value", "roots", "classes")
+
+
+class CompiledGBDT:
+    """
+    Binary HistGradientBoostingClassifier flattened into plain NumPy arrays.
+
+    All trees live in one node table (feature, threshold, missing_go_to_left, left, right,
+    value), children indices are global and leaves point to themselves, so a chunk of
+    samples walks every tree at once in max_depth vectorized steps. Leaf values are summed
+    tree by tree in sklearn's order on top of the baseline and passed through the same
+    expit, so predict_proba matches sklearn bit for bit without importing it.
+    """
+
+    chunk_size = 1024  # samples per traversal, keeps the (n_trees, chunk) node array in cache
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        missing_left: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        max_depth: int,
+        baseline: float,
+        classes: np.ndarray,
+        n_features: int,
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.missing_left = missing_left
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.baseline = baseline
+        self.classes_ = classes
+        self.n_features_in_ = n_features
+        # children[2 * node + went_left]
+        self._children = np.stack((right, left), axis=1).ravel().astype(np.intp)
+        self._feature = feature.astype(np.intp)
+
+    @classmethod
+    def from_sklearn(cls, gbdt: object) -> "CompiledGBDT":
+        if getattr(gbdt, "n_trees_per_iteration_", None) != 1 or len(gbdt.classes_) != 2:
+            raise ValueError("Only binary HistGradientBoostingClassifier models can be compiled")
+        if getattr(gbdt, "is_categorical_", None) is not None and np.any(gbdt.is_categorical_):
+            raise ValueError("Categorical features are not supported")
+
+        tables = [predictors[0].nodes for predictors in gbdt._predictors]
+        sizes = np.array([len(t) for t in tables], dtype=np.int64)
+        roots = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.int64)
+        nodes = np.concatenate(tables)
+        offsets = np.repeat(roots, sizes)
+
+        own = np.arange(len(nodes), dtype=np.int64)
+        leaf = nodes["is_leaf"].astype(bool)
+        left = np.where(leaf, own, nodes["left"].astype(np.int64) + offsets)
+        right = np.where(leaf, own, nodes["right"].astype(np.int64) + offsets)
+
+        return cls(
+            feature=np.where(leaf, 0, nodes["feature_idx"]).astype(np.int64),
+            threshold=nodes["num_threshold"].astype(np.float64),
+            missing_left=nodes["missing_go_to_left"].astype(bool),
+            left=left,
+            right=right,
+            value=nodes["value"].astype(np.float64),
+            roots=roots,
+            max_depth=int(nodes["depth"].max()),
+            baseline=float(np.ravel(gbdt._baseline_prediction)[0]),
+            classes=np.asarray(gbdt.classes_),
+            n_features=int(gbdt.n_features_in_),
+        )
+
+    def _arrays(self) -> dict:
+        return {
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "missing_left": self.missing_left,
+            "left": self.left,
+            "right": self.right,
+            "value": self.value,
+            "roots": self.roots,
+            "classes": self.classes_,
+        }
+
+    def _scalars(self) -> dict:
+        return {"max_depth": self.max_depth, "baseline": self.baseline, "n_features": self.n_features_in_}
+
+    @classmethod
+    def _from_parts(cls, arrays: dict, scalars: dict) -> "CompiledGBDT":
+        return cls(
+            feature=arrays["feature"],
+            threshold=arrays["threshold"],
+            missing_left=arrays["missing_left"],
+            left=arrays["left"],
+            right=arrays["right"],
+            value=arrays["value"],
+            roots=arrays["roots"],
+            max_depth=int(scalars["max_depth"]),
+            baseline=float(scalars["baseline"]),
+            classes=arrays["classes"],
+            n_features=int(scalars["n_features"]),
+        )
+
+    def save(self, path: str) -> None:
+        """
+        "*.npz" -> one archive; any other path -> a directory of .npy files + meta.json,
+        which load() memory-maps so that worker processes share one copy.
+        """
+        path = os.fspath(path)
+        if path.endswith(".npz"):
+            np.savez(path, **self._arrays(), **self._scalars())
+            return
+        os.makedirs(path, exist_ok=True)
+        for name, arr in self._arrays().items():
+            np.save(os.path.join(path, f"{name}.npy"), arr)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(self._scalars(), f)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Optional[str] = "r") -> "CompiledGBDT":
+        path = os.fspath(path)
+        if os.path.isdir(path):
+            arrays = {
+                name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+                for name in _ARRAYS
+            }
+            with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+                return cls._from_parts(arrays, json.load(f))
+        with np.load(path, allow_pickle=False) as f:
+            return cls._from_parts({name: f[name] for name in _ARRAYS}, f)
+
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected X of shape (n, {self.n_features_in_}), got {X.shape}")
+        out = np.empty(X.shape[0], dtype=np.float64)
+        for lo in range(0, X.shape[0], self.chunk_size):
+            chunk = X[lo : lo + self.chunk_size]
+            out[lo : lo + len(chunk)] = self._raw_chunk(chunk)
+        return out
+
+    def _raw_chunk(self, X: np.ndarray) -> np.ndarray:
+        n = X.shape[0]
+        xt = np.ascontiguousarray(X.T).ravel()  # feature-major: xt[f * n + i]
+        has_nan = bool(np.isnan(xt).any())
+        cols = np.arange(n, dtype=np.intp)
+
+        node = np.repeat(self.roots.astype(np.intp)[:, None], n, axis=1)  # (n_trees, n)
+        for _ in range(self.max_depth):
+            x = xt.take(self._feature.take(node) * n + cols)
+            go_left = x <= self.threshold.take(node)
+            if has_nan:
+                go_left |= np.isnan(x) & self.missing_left.take(node)
+            node = self._children.take(2 * node + go_left)
+
+        # cumulative sum runs tree by tree, the same order sklearn adds predictions in
+        raw = np.empty((len(self.roots) + 1, n), dtype=np.float64)
+        raw[0] = self.baseline
+        raw[1:] = self.value.take(node)
+        return np.cumsum(raw, axis=0)[-1]
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        from scipy.special import expit
+
+        p = expit(self.decision_function(X))
+        return np.column_stack((1.0 - p, p))
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_[(self.decision_function(X) > 0).astype(np.int64)]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compile a joblib HistGradientBoostingClassifier.")
+    parser.add_argument("model_path", help="e.g. models/gbdt_topic_window.joblib")
+    parser.add_argument("output", help="models/gbdt_topic_window.npz, or a directory for memory-mapped loading")
+    args = parser.parse_args(argv)
+
+    import joblib
+
+    CompiledGBDT.from_sklearn(joblib.load(args.model_path)).save(args.output)
+    print(f"Saved compiled model to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
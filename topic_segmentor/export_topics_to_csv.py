@@ -1,34 +1,153 @@
-from typing import List
+from typing import IO, Iterable, Iterator, List, Optional, Tuple
+from itertools import chain
 from topic_segmentor import Topic
 import csv
+import gzip
 
 
-def export_topics_to_csv(filename: str, topics: List[Topic]):
-    topic_size = len(topics[0])
-    if topic_size < 2:
+def _header(width: int) -> List[str]:
+    return (
+        [f"context_{i}" for i in range(width - 1, 0, -1)]
+        + ["response"]
+    )
+
+
+def _topic_rows(
+    topics: Iterable[Topic],
+    topic_size: Optional[int],
+    ragged: bool,
+    max_topic_size: Optional[int],
+    pad: Optional[str],
+) -> Tuple[List[str], Iterator[List[Optional[str]]]]:
+    """
+    -> (header, rows) without materializing the topics.
+
+    Fixed mode: every topic must have topic_size messages (taken from the first topic if None).
+    Ragged mode: topics of 2..max_topic_size messages, missing oldest contexts are filled with pad.
+    """
+    it = iter(topics)
+    head: List[Topic] = []
+    if ragged:
+        if max_topic_size is None:
+            raise ValueError("max_topic_size is required for ragged export")
+        width = max_topic_size
+    elif topic_size is None:
+        first = next(it, None)
+        if first is None:
+            raise ValueError("No topics to export")
+        head.append(first)
+        width = len(first)
+    else:
+        width = topic_size
+
+    if width < 2:
         raise ValueError("topic size must be >= 2")
 
-    for i, t in enumerate(topics):
-        if len(t) != topic_size:
-            raise ValueError(
-                f"Topic at index {i} has size {len(t)}, expected {topic_size}"
-            )
+    def rows() -> Iterator[List[Optional[str]]]:
+        for i, topic in enumerate(chain(head, it)):
+            size = len(topic)
+            if ragged:
+                if not 2 <= size <= width:
+                    raise ValueError(
+                        f"Topic at index {i} has size {size}, expected 2..{width}"
+                    )
+            elif size != width:
+                raise ValueError(
+                    f"Topic at index {i} has size {size}, expected {width}"
+                )
 
-    context_size = topic_size - 1
+            texts = [msg.text for msg in topic]
 
-    header = (
-        [f"context_{i}" for i in range(context_size, 0, -1)]
-        + ["response"]
-    )
+            response = texts[-1]
+            contexts = [pad] * (width - size) + texts[:-1]
+
+            yield contexts + [response]
+
+    return _header(width), rows()
 
-    with open(filename, "w", encoding="utf-8", newline="") as f:
+
+def _open_text(filename: str) -> IO[str]:
+    if filename.endswith(".gz"):
+        return gzip.open(filename, "wt", encoding="utf-8", newline="")
+    if filename.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError("zstandard is required to write .zst files: pip install zstandard") from e
+        return zstandard.open(filename, "wt", encoding="utf-8", newline="")
+    return open(filename, "w", encoding="utf-8", newline="")
+
+
+def export_topics_to_csv(
+    filename: str,
+    topics: Iterable[Topic],
+    topic_size: Optional[int] = None,
+    ragged: bool = False,
+    max_topic_size: Optional[int] = None,
+    chunk_size: int = 1024,
+) -> int:
+    """
+    Streams topics (a list or any iterable, e.g. a segmentor generator) into a CSV file
+    with columns context_{n-1}, ..., context_1, response, writing chunk_size rows at a time.
+    "*.gz" / "*.zst" filenames are compressed. Returns the number of topics written.
+    """
+    header, rows = _topic_rows(topics, topic_size, ragged, max_topic_size, pad="")
+
+    written = 0
+    with _open_text(filename) as f:
         writer = csv.writer(f)
         writer.writerow(header)
 
-        for topic in topics:
-            texts = [msg.text for msg in topic]
+        buf: List[List[Optional[str]]] = []
+        for row in rows:
+            buf.append(row)
+            if len(buf) >= chunk_size:
+                writer.writerows(buf)
+                written += len(buf)
+                buf = []
+        writer.writerows(buf)
+        written += len(buf)
 
-            response = texts[-1]
-            contexts = list((texts[:-1]))
+    return written
+
+
+def export_topics_to_parquet(
+    filename: str,
+    topics: Iterable[Topic],
+    topic_size: Optional[int] = None,
+    ragged: bool = False,
+    max_topic_size: Optional[int] = None,
+    chunk_size: int = 65536,
+) -> int:
+    """
+    Same layout as export_topics_to_csv, written as Parquet row groups of chunk_size topics.
+    Missing contexts of ragged topics are null. Requires pyarrow.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("pyarrow is required for Parquet export: pip install pyarrow") from e
+
+    header, rows = _topic_rows(topics, topic_size, ragged, max_topic_size, pad=None)
+    schema = pa.schema([(name, pa.string()) for name in header])
+
+    written = 0
+    with pq.ParquetWriter(filename, schema) as writer:
+
+        def flush(buf: List[List[Optional[str]]]) -> None:
+            columns = dict(zip(header, map(list, zip(*buf))))
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+
+        buf: List[List[Optional[str]]] = []
+        for row in rows:
+            buf.append(row)
+            if len(buf) >= chunk_size:
+                flush(buf)
+                written += len(buf)
+                buf = []
+        if buf:
+            flush(buf)
+            written += len(buf)
 
-            writer.writerow(contexts + [response])
\ No newline at end of file
+    return written
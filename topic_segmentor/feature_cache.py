@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+from typing import Iterable, Tuple
+
+import numpy as np
+
+from .message_store import MessageStore
+
+# odd 64-bit multiplier for combining message digests into a window key
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def file_digest(paths: Iterable[str]) -> str:
+    """
+    sha256 over the contents of model artifact files (all files of a directory artifact).
+    """
+    h = hashlib.sha256()
+    for path in paths:
+        files = [path]
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+            )
+        for file in files:
+            h.update(os.path.relpath(file, path).encode("utf-8") + b"\0")
+            with open(file, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+    return h.hexdigest()
+
+
+def message_digests(store: MessageStore) -> np.ndarray:
+    """
+    Stable 64-bit content hash of every message (id, user, timestamp, text).
+    """
+    out = np.empty(len(store), dtype=np.uint64)
+    ids = store.ids.tolist()
+    ts = store.timestamps.tolist()
+    codes = store.user_codes.tolist()
+    users = [u.encode("utf-8") for u in store.users]
+    for i, text in enumerate(store.texts()):
+        h = hashlib.blake2b(digest_size=8)
+        h.update(f"{ids[i]}\x1f{ts[i]}\x1f".encode("ascii"))
+        h.update(users[codes[i]])
+        h.update(b"\x1f")
+        h.update(text.encode("utf-8"))
+        out[i] = int.from_bytes(h.digest(), "little")
+    return out
+
+
+def window_keys(digests: np.ndarray, starts: np.ndarray, k: int) -> np.ndarray:
+    """
+    Key of window [s, s + k): the k message digests folded in order, as signed int64 for SQLite.
+    """
+    keys = np.full(len(starts), k, dtype=np.uint64)
+    for j in range(k):
+        keys = keys * _MIX + digests[starts + j]
+    return keys.view(np.int64)
+
+
+class WindowProbaCache:
+    """
+    SQLite file of P(single-topic) per window, keyed by the model artifact hash and the
+    content of the window's messages. Windows do not depend on max_gap_seconds or
+    threshold, so re-runs with other values skip featurization and prediction.
+    """
+
+    _BATCH = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS window_proba ("
+            " model TEXT NOT NULL, key INTEGER NOT NULL, proba REAL NOT NULL,"
+            " PRIMARY KEY (model, key)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def get(self, model: str, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        -> (probas, hit mask); probas of missing windows are nan.
+        """
+        probas = np.full(len(keys), np.nan, dtype=np.float64)
+        found = {}
+        key_list = keys.tolist()
+        for lo in range(0, len(key_list), self._BATCH):
+            batch = key_list[lo : lo + self._BATCH]
+            marks = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT key, proba FROM window_proba WHERE model = ? AND key IN ({marks})",
+                [model, *batch],
+            )
+            found.update(rows)
+        if found:
+            probas[:] = [found.get(k, np.nan) for k in key_list]
+        return probas, ~np.isnan(probas)
+
+    def put(self, model: str, keys: np.ndarray, probas: np.ndarray) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO window_proba (model, key, proba) VALUES (?, ?, ?)",
+            zip([model] * len(keys), keys.tolist(), probas.tolist()),
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
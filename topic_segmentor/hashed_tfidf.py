@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import os
+import zlib
+from typing import Optional, Sequence
+
+import numpy as np
+
+from .model_artifacts import MmapTfidfVectorizer, _read_meta
+
+
+class HashedVocabulary:
+    """
+    Term -> bucket by crc32 of the UTF-8 term: no stored terms, same buckets in every
+    process and Python version. Every term maps somewhere, collisions share a column.
+    """
+
+    def __init__(self, n_features: int):
+        self.n_features = n_features
+
+    def __len__(self) -> int:
+        return self.n_features
+
+    def lookup(self, terms: Sequence[str]) -> np.ndarray:
+        crc = np.fromiter((zlib.crc32(t.encode("utf-8")) for t in terms), dtype=np.int64, count=len(terms))
+        return crc % self.n_features
+
+    def get(self, term: str, default: Optional[int] = None) -> int:
+        return zlib.crc32(term.encode("utf-8")) % self.n_features
+
+    def __contains__(self, term: str) -> bool:
+        return True
+
+
+class HashedTfidfVectorizer(MmapTfidfVectorizer):
+    """
+    TF-IDF over n_features hashed buckets instead of a fitted vocabulary.
+
+    The only fitted state is the smoothed idf per bucket, idf = ln((1 + n) / (1 + df)) + 1
+    as in sklearn. Document frequencies are additive, so partial_fit over shards of the
+    training texts (in any order or process) gives the same model as one fit().
+    Tokenization, transform and the per-message cache work as for MmapTfidfVectorizer.
+    """
+
+    kind = "hashed"
+
+    def __init__(
+        self,
+        n_features: int = 2 ** 18,
+        lowercase: bool = True,
+        strip_accents: Optional[str] = None,
+        token_pattern: str = r"(?u)\b\w\w+\b",
+        ngram_range: tuple = (1, 2),
+        stop_words: Optional[Sequence[str]] = None,
+        norm: Optional[str] = "l2",
+        df: Optional[np.ndarray] = None,
+        n_docs: int = 0,
+        idf: Optional[np.ndarray] = None,
+    ):
+        super().__init__(
+            vocabulary=HashedVocabulary(n_features),
+            idf=np.ones(n_features, dtype=np.float64),
+            lowercase=lowercase,
+            strip_accents=strip_accents,
+            token_pattern=token_pattern,
+            ngram_range=ngram_range,
+            stop_words=stop_words,
+            norm=norm,
+        )
+        self.n_features = n_features
+        self.df_ = np.zeros(n_features, dtype=np.int64) if df is None else df
+        self.n_docs_ = n_docs
+        if idf is not None:
+            self.idf_ = idf
+        elif n_docs:
+            self._update_idf()
+
+    def _update_idf(self) -> None:
+        self.idf_ = np.log((1.0 + self.n_docs_) / (1.0 + self.df_)) + 1.0
+
+    def document_frequencies(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Number of texts containing each bucket; sums over shards give the df of their union.
+        """
+        preprocess, tokenize = self.build_preprocessor(), self.build_tokenizer()
+        buckets = [
+            np.unique(self.vocabulary_.lookup(self._word_ngrams(tokenize(preprocess(t)))))
+            for t in texts
+        ]
+        if not buckets:
+            return np.zeros(self.n_features, dtype=np.int64)
+        return np.bincount(np.concatenate(buckets), minlength=self.n_features)
+
+    def partial_fit(self, texts: Sequence[str]) -> "HashedTfidfVectorizer":
+        self.df_ = self.df_ + self.document_frequencies(texts)
+        self.n_docs_ += len(texts)
+        self._update_idf()
+        return self
+
+    def fit(self, texts: Sequence[str]) -> "HashedTfidfVectorizer":
+        self.df_ = np.zeros(self.n_features, dtype=np.int64)
+        self.n_docs_ = 0
+        return self.partial_fit(texts)
+
+    def fit_transform(self, texts: Sequence[str]):
+        return self.fit(texts).transform(texts)
+
+    def transform(self, texts: Sequence[str]):
+        if not self.n_docs_:
+            raise ValueError("HashedTfidfVectorizer is not fitted")
+        return super().transform(texts)
+
+    def save(self, path: str) -> None:
+        self._write_meta(path, {**self._meta(), "n_features": self.n_features, "n_docs": self.n_docs_})
+        np.save(os.path.join(path, "df.npy"), self.df_)
+        np.save(os.path.join(path, "idf.npy"), self.idf_)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Optional[str] = "r") -> "HashedTfidfVectorizer":
+        def arr(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, name), mmap_mode=mmap_mode, allow_pickle=False)
+
+        meta = _read_meta(path)
+        meta.pop("kind", None)
+        return cls(df=arr("df.npy"), idf=arr("idf.npy"), **meta)
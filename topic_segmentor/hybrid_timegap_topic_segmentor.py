@@ -1,11 +1,45 @@
 from __future__ import annotations
 
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
 
-from .topic_segmentor import TopicSegmentor, Topic, ChatMessage
+import numpy as np
+
+from .topic_segmentor import TopicSegmentor, Topic, ChatMessage, MessageSource
+from .message_store import MessageStore, as_store
+from .feature_cache import WindowProbaCache, file_digest, message_digests, window_keys
 from .window_topic_model import WindowTopicModel
 
+# (model, store) of a shard worker process, set by its pool initializer
+_SHARD_STATE: Optional[Tuple[WindowTopicModel, MessageStore]] = None
+
+
+def _init_shard_worker(model: WindowTopicModel, store: MessageStore) -> None:
+    global _SHARD_STATE
+    _SHARD_STATE = (model, store)
+
+
+def _score_shard(
+    task: Tuple[int, int, np.ndarray],
+    model: Optional[WindowTopicModel] = None,
+    store: Optional[MessageStore] = None,
+) -> np.ndarray:
+    if model is None:
+        model, store = _SHARD_STATE
+    lo, hi, starts = task
+    return model.predict_proba_windows(store.slice(lo, hi), starts - lo)
+
+
+@dataclass
+class SweepResult:
+    max_gap_seconds: int
+    threshold: float
+    topics: int
+    coverage: float  # share of messages that ended up in a topic
+
 
 @dataclass
 class HybridTimeGapMLTopicSegmentor(TopicSegmentor):
@@ -13,12 +47,22 @@ class HybridTimeGapMLTopicSegmentor(TopicSegmentor):
     1) Split messages into coarse "sessions" by time gap (bigger gap allowed).
     2) Inside each session generate sliding windows of size topic_size.
     3) Score each window by ML model P(single-topic).
-    4) Select non-overlapping windows greedily by time, keeping only windows with proba >= threshold.
+    4) Select non-overlapping windows greedily by time, keeping only windows with proba >= threshold
+       (or, with selection="weighted", the non-overlapping set with the largest total proba).
+
+    With n_jobs > 1 step 3 is sharded on session boundaries across worker processes
+    (forked, sharing the loaded models) or threads; the result is the same as a serial run.
+    With cache_path set, step 3 results are kept in a SQLite file and reused by later runs
+    on the same messages and models, whatever max_gap_seconds / threshold they use.
     """
     max_gap_seconds: int = 15 * 60
     threshold: float = 0.7
     tfidf_path: str = "models/tfidf_feat.joblib"
     model_path: str = "models/gbdt_topic_window.joblib"
+    n_jobs: int = 1
+    parallel_backend: str = "process"
+    selection: str = "greedy"
+    cache_path: Optional[str] = None
 
     def __init__(
         self,
@@ -27,81 +71,224 @@ class HybridTimeGapMLTopicSegmentor(TopicSegmentor):
         threshold: float = 0.7,
         tfidf_path: str = "models/tfidf_feat.joblib",
         model_path: str = "models/gbdt_topic_window.joblib",
+        n_jobs: int = 1,
+        parallel_backend: str = "process",
+        selection: str = "greedy",
+        cache_path: Optional[str] = None,
     ):
         super().__init__(topic_size)
+        if parallel_backend not in ("process", "thread"):
+            raise ValueError("parallel_backend must be 'process' or 'thread'")
+        if selection not in ("greedy", "weighted"):
+            raise ValueError("selection must be 'greedy' or 'weighted'")
         self.max_gap_seconds = max_gap_seconds
         self.threshold = threshold
         self.tfidf_path = tfidf_path
         self.model_path = model_path
+        self.n_jobs = n_jobs
+        self.parallel_backend = parallel_backend
+        self.selection = selection
+        self.cache_path = cache_path
         self._model = WindowTopicModel.load(tfidf_path, model_path, topic_size=topic_size)
+        self._cache: Optional[WindowProbaCache] = None
+        self._model_hash: Optional[str] = None
+        if cache_path is not None:
+            self._cache = WindowProbaCache(cache_path)
+            self._model_hash = file_digest([tfidf_path, model_path])
 
-    def _split_sessions(self, messages: List[ChatMessage]) -> List[List[ChatMessage]]:
-        if not messages:
-            return []
-        sessions: List[List[ChatMessage]] = []
-        cur = [messages[0]]
-        for m in messages[1:]:
-            if (m.timestamp - cur[-1].timestamp) <= self.max_gap_seconds:
-                cur.append(m)
-            else:
-                sessions.append(cur)
-                cur = [m]
-        sessions.append(cur)
-        return sessions
+    def _split_sessions(self, timestamps: np.ndarray, max_gap_seconds: Optional[int] = None) -> np.ndarray:
+        """
+        Session boundaries [0, b1, ..., n]: session i is messages[bounds[i] : bounds[i + 1]].
+        A new session starts where the gap to the previous message exceeds max_gap_seconds.
+        """
+        if max_gap_seconds is None:
+            max_gap_seconds = self.max_gap_seconds
+        n = len(timestamps)
+        if n == 0:
+            return np.zeros(1, dtype=np.int64)
+        breaks = np.flatnonzero(np.diff(timestamps) > max_gap_seconds) + 1
+        return np.concatenate(([0], breaks, [n])).astype(np.int64)
 
     @staticmethod
-    def _windows(msgs: List[ChatMessage], k: int) -> List[Tuple[int, List[ChatMessage]]]:
-        out = []
-        for i in range(0, len(msgs) - k + 1):
-            out.append((i, msgs[i : i + k]))
-        return out
+    def _windows(bounds: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Sliding windows of size k inside each session as (start, end) index arrays.
+        """
+        sess_start = bounds[:-1]
+        counts = np.maximum(bounds[1:] - sess_start - k + 1, 0)
+        total = int(counts.sum())
+        first = np.cumsum(counts) - counts
+        starts = np.repeat(sess_start, counts) + (np.arange(total) - np.repeat(first, counts))
+        return starts, starts + k
+
+    @staticmethod
+    def _shards(bounds: np.ndarray, starts: np.ndarray, n_shards: int) -> List[Tuple[int, int]]:
+        """
+        Splits the window array into up to n_shards contiguous [lo, hi) pieces of similar size,
+        cutting only between sessions.
+        """
+        total = len(starts)
+        session = np.searchsorted(bounds, starts, side="right") - 1
+        targets = (np.arange(1, n_shards) * total) // n_shards
+        cuts = np.searchsorted(session, session[targets], side="left")
+        cuts = np.unique(np.concatenate(([0], cuts, [total])))
+        return [(int(lo), int(hi)) for lo, hi in zip(cuts[:-1], cuts[1:]) if hi > lo]
+
+    def _score_windows(self, store: MessageStore, bounds: np.ndarray, starts: np.ndarray) -> np.ndarray:
+        if self._cache is None or len(starts) == 0:
+            return self._predict_windows(store, bounds, starts)
+
+        keys = window_keys(message_digests(store), starts, self.get_topic_size())
+        probas, hit = self._cache.get(self._model_hash, keys)
+        miss = np.flatnonzero(~hit)
+        if len(miss):
+            probas[miss] = self._predict_windows(store, bounds, starts[miss])
+            self._cache.put(self._model_hash, keys[miss], probas[miss])
+        return probas
+
+    def _predict_windows(self, store: MessageStore, bounds: np.ndarray, starts: np.ndarray) -> np.ndarray:
+        n_jobs = self.n_jobs if self.n_jobs > 0 else (os.cpu_count() or 1)
+        if n_jobs <= 1 or len(starts) < 2 * self._model.batch_size:
+            return self._model.predict_proba_windows(store, starts)
+
+        k = self.get_topic_size()
+        shards = self._shards(bounds, starts, n_jobs)
+        # every shard scores a slice of the store covering just its own windows
+        tasks = [(int(starts[lo]), int(starts[hi - 1]) + k, starts[lo:hi]) for lo, hi in shards]
+
+        if self.parallel_backend == "thread":
+            with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+                return np.concatenate(list(pool.map(lambda t: _score_shard(t, self._model, store), tasks)))
+
+        # the state goes to each pool through its initializer, so concurrent segmentations don't
+        # share it; forked children inherit the initializer arguments, nothing is pickled
+        ctx = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else None
+        with ProcessPoolExecutor(
+            max_workers=n_jobs, mp_context=ctx, initializer=_init_shard_worker, initargs=(self._model, store)
+        ) as pool:
+            return np.concatenate(list(pool.map(_score_shard, tasks)))
 
     def _select_non_overlapping(
-        self, scored: List[Tuple[int, float, List[ChatMessage]]]
-    ) -> List[Topic]:
+        self,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        probas: np.ndarray,
+        threshold: Optional[float] = None,
+    ) -> np.ndarray:
+        """
+        Indices of picked windows [starts[j], ends[j]) with proba >= threshold (self.threshold
+        by default), no two overlapping.
+
+        greedy: by window end (= end timestamp for ordered messages), accept if it starts
+                at or after the end of the last accepted window.
+        weighted: weighted interval scheduling, maximizes the sum of probas (O(N log N) DP).
+        """
+        if threshold is None:
+            threshold = self.threshold
+        cand = np.flatnonzero(probas >= threshold)
+        cand = cand[np.argsort(ends[cand], kind="stable")]
+        if len(cand) == 0:
+            return cand
+
+        c_starts = starts[cand].tolist()
+        c_ends = ends[cand].tolist()
+
+        if self.selection == "greedy":
+            picked: List[int] = []
+            last_end = -1
+            for j, (lo, hi) in enumerate(zip(c_starts, c_ends)):
+                if lo >= last_end:
+                    picked.append(j)
+                    last_end = hi
+            return cand[picked]
+
+        # prev[j]: number of candidates ending at or before candidate j starts
+        prev = np.searchsorted(ends[cand], starts[cand], side="right").tolist()
+        weights = probas[cand].tolist()
+        best = [0.0] * (len(cand) + 1)
+        take = [False] * len(cand)
+        for j, w in enumerate(weights):
+            with_j = w + best[prev[j]]
+            take[j] = with_j > best[j]
+            best[j + 1] = with_j if take[j] else best[j]
+
+        picked = []
+        j = len(cand)
+        while j > 0:
+            if take[j - 1]:
+                picked.append(j - 1)
+                j = prev[j - 1]
+            else:
+                j -= 1
+        return cand[picked[::-1]]
+
+    def sweep(
+        self,
+        source: MessageSource,
+        max_gap_values: Iterable[int],
+        thresholds: Iterable[float],
+    ) -> List[SweepResult]:
         """
-        scored: list of (global_start_index, proba, window)
-        We want windows that do not overlap in message indices.
-        Greedy by time: sort by window end timestamp, accept if no overlap.
+        Topic count and coverage for every (max_gap_seconds, threshold) pair, scoring windows once.
+
+        A window exists for gap g iff none of its internal time gaps exceeds g, so the windows
+        of the largest gap are scored and every smaller gap just masks them; each threshold
+        then only reruns selection. Results equal segment() of a segmentor built with that pair.
         """
-        if not scored:
+        gaps = sorted(set(max_gap_values))
+        thresholds = sorted(set(thresholds))
+        if not gaps or not thresholds:
             return []
 
-        scored.sort(key=lambda x: x[2][-1].timestamp)
+        k = self.get_topic_size()
+        store = as_store(self._message_sequence(source))
+        n = len(store)
 
-        used_ids = set()
-        picked: List[Topic] = []
-        for _, p, w in scored:
-            if p < self.threshold:
-                continue
-            ids = [m.id for m in w if hasattr(m, "id")]
-            if not ids:
-                ids = [hash((m.user, m.text, m.timestamp)) for m in w]
+        bounds = self._split_sessions(store.timestamps, gaps[-1])
+        starts, ends = self._windows(bounds, k)
+        probas = self._score_windows(store, bounds, starts)
 
-            if any(i in used_ids for i in ids):
-                continue
+        # largest time gap inside each window
+        dt = np.diff(store.timestamps)
+        inner = np.zeros(len(starts), dtype=dt.dtype)
+        for j in range(k - 1):
+            inner = np.maximum(inner, dt[starts + j])
 
-            picked.append(w)
-            used_ids.update(ids)
+        results: List[SweepResult] = []
+        for g in gaps:
+            keep = np.flatnonzero(inner <= g)
+            g_starts, g_ends, g_probas = starts[keep], ends[keep], probas[keep]
+            for th in thresholds:
+                picked = self._select_non_overlapping(g_starts, g_ends, g_probas, threshold=th)
+                results.append(
+                    SweepResult(
+                        max_gap_seconds=g,
+                        threshold=th,
+                        topics=len(picked),
+                        coverage=len(picked) * k / n if n else 0.0,
+                    )
+                )
+        return results
 
-        return picked
+    def iter_topics(self, source: MessageSource, chunk_messages: int = 10_000) -> Iterator[Topic]:
+        """
+        Streams topics chunk by chunk; chunks hold whole gap-separated runs of at least
+        chunk_messages messages, so memory and latency are bounded by the chunk, not the chat.
+        """
+        for chunk in self._iter_gap_chunks(source, self.max_gap_seconds, chunk_messages):
+            yield from self.segment(chunk)
 
-    def get_topics(self, path: str) -> List[Topic]:
-        messages = self.load_messages(path)
+    def segment(self, messages: Sequence[ChatMessage]) -> List[Topic]:
         if not messages:
             return []
 
         k = self.get_topic_size()
-        sessions = self._split_sessions(messages)
-
-        all_scored: List[Tuple[int, float, List[ChatMessage]]] = []
-        global_offset = 0
+        store = as_store(messages)
+        bounds = self._split_sessions(store.timestamps)
+        starts, ends = self._windows(bounds, k)
 
-        for sess in sessions:
-            for local_i, w in self._windows(sess, k):
-                p = self._model.predict_proba_single_topic(w)
-                all_scored.append((global_offset + local_i, p, w))
-            global_offset += len(sess)
+        probas = self._score_windows(store, bounds, starts)
 
-        topics = self._select_non_overlapping(all_scored)
-        return topics
\ No newline at end of file
+        picked = self._select_non_overlapping(starts, ends, probas)
+        topics = [list(messages[lo:hi]) for lo, hi in zip(starts[picked].tolist(), ends[picked].tolist())]
+        return topics
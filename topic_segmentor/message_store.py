@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union, overload
+
+import numpy as np
+
+from .message_stream import OutOfOrderError, sorted_by_key
+from .topic_segmentor import ChatMessage, TopicSegmentor, _message_timestamp
+
+NO_REPLY = np.iinfo(np.int64).min
+
+_FIELDS = ("id", "user", "text", "timestamp", "reply_to_id")
+
+
+class MessageView:
+    """
+    Read-only row of a MessageStore with the attributes of ChatMessage.
+    """
+    __slots__ = ("_store", "_i")
+
+    def __init__(self, store: "MessageStore", i: int):
+        self._store = store
+        self._i = i
+
+    @property
+    def id(self) -> int:
+        return int(self._store.ids[self._i])
+
+    @property
+    def user(self) -> str:
+        return self._store.user(self._i)
+
+    @property
+    def text(self) -> str:
+        return self._store.text(self._i)
+
+    @property
+    def timestamp(self) -> int:
+        return int(self._store.timestamps[self._i])
+
+    @property
+    def reply_to_id(self) -> Optional[int]:
+        r = int(self._store.reply_to_ids[self._i])
+        return None if r == NO_REPLY else r
+
+    def _key(self) -> tuple:
+        return tuple(getattr(self, f) for f in _FIELDS)
+
+    def __eq__(self, other: object) -> bool:
+        if not all(hasattr(other, f) for f in _FIELDS):
+            return NotImplemented
+        return self._key() == tuple(getattr(other, f) for f in _FIELDS)
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{f}={getattr(self, f)!r}" for f in _FIELDS)
+        return f"MessageView({fields})"
+
+    def to_message(self) -> ChatMessage:
+        return ChatMessage(*self._key())
+
+
+class MessageStore(Sequence[MessageView]):
+    """
+    Columnar, read-only list of chat messages:
+      - ids, timestamps, reply_to_ids (NO_REPLY for None): int64 arrays
+      - user_codes: int32 index into the interned users table
+      - texts: one UTF-8 buffer, message i is buffer[text_offsets[i] : text_offsets[i + 1]]
+    Indexing returns MessageView objects, so segmentors can use it like List[ChatMessage].
+    """
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        timestamps: np.ndarray,
+        reply_to_ids: np.ndarray,
+        user_codes: np.ndarray,
+        users: List[str],
+        text_buffer: bytes,
+        text_offsets: np.ndarray,
+    ):
+        n = len(ids)
+        if not (len(timestamps) == len(reply_to_ids) == len(user_codes) == n and len(text_offsets) == n + 1):
+            raise ValueError("MessageStore columns must have the same length")
+        self.ids = ids
+        self.timestamps = timestamps
+        self.reply_to_ids = reply_to_ids
+        self.user_codes = user_codes
+        self.users = users
+        self._text_buffer = text_buffer
+        self.text_offsets = text_offsets
+
+    @classmethod
+    def from_messages(cls, messages: Iterable[ChatMessage]) -> "MessageStore":
+        if isinstance(messages, MessageStore):
+            return messages
+
+        ids, timestamps, replies = array("q"), array("q"), array("q")
+        user_codes = array("i")
+        offsets = array("q", [0])
+        buffer = bytearray()
+        users: List[str] = []
+        user_index: Dict[str, int] = {}
+
+        for m in messages:
+            ids.append(m.id)
+            timestamps.append(m.timestamp)
+            replies.append(NO_REPLY if m.reply_to_id is None else m.reply_to_id)
+            code = user_index.get(m.user)
+            if code is None:
+                code = user_index[m.user] = len(users)
+                users.append(m.user)
+            user_codes.append(code)
+            buffer += m.text.encode("utf-8")
+            offsets.append(len(buffer))
+
+        return cls(
+            ids=np.frombuffer(ids, dtype=np.int64),
+            timestamps=np.frombuffer(timestamps, dtype=np.int64),
+            reply_to_ids=np.frombuffer(replies, dtype=np.int64),
+            user_codes=np.frombuffer(user_codes, dtype=np.int32),
+            users=users,
+            text_buffer=bytes(buffer),
+            text_offsets=np.frombuffer(offsets, dtype=np.int64),
+        )
+
+    @classmethod
+    def load(cls, path: str, run_size: Optional[int] = 1_000_000) -> "MessageStore":
+        """
+        Streams a JSON message file straight into columns in timestamp order. A file that
+        turns out not to be ordered is read again through an external sort (at most run_size
+        messages in memory), nothing is spilled to disk for ordered files.
+        """
+        try:
+            return cls.from_messages(TopicSegmentor.iter_messages(path))
+        except OutOfOrderError:
+            messages = sorted_by_key(TopicSegmentor.read_messages(path), key=_message_timestamp, run_size=run_size)
+            return cls.from_messages(messages)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @overload
+    def __getitem__(self, i: int) -> MessageView: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> List[MessageView]: ...
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[MessageView, List[MessageView]]:
+        if isinstance(i, slice):
+            return [MessageView(self, j) for j in range(*i.indices(len(self)))]
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("MessageStore index out of range")
+        return MessageView(self, int(i))
+
+    def __iter__(self) -> Iterator[MessageView]:
+        for i in range(len(self)):
+            yield MessageView(self, i)
+
+    def user(self, i: int) -> str:
+        return self.users[self.user_codes[i]]
+
+    def text(self, i: int) -> str:
+        return self._text_buffer[self.text_offsets[i] : self.text_offsets[i + 1]].decode("utf-8")
+
+    def texts(self, start: int = 0, end: Optional[int] = None) -> List[str]:
+        end = len(self) if end is None else end
+        off = self.text_offsets[start : end + 1].tolist()
+        buf = self._text_buffer
+        return [buf[a:b].decode("utf-8") for a, b in zip(off, off[1:])]
+
+    def slice(self, start: int, end: int) -> "MessageStore":
+        """
+        Rows [start, end) as a store sharing this store's arrays and text buffer.
+        """
+        start, end, _ = slice(start, end).indices(len(self))
+        end = max(start, end)
+        return MessageStore(
+            ids=self.ids[start:end],
+            timestamps=self.timestamps[start:end],
+            reply_to_ids=self.reply_to_ids[start:end],
+            user_codes=self.user_codes[start:end],
+            users=self.users,
+            text_buffer=self._text_buffer,
+            text_offsets=self.text_offsets[start : end + 1],
+        )
+
+
+def as_store(messages: Sequence[ChatMessage]) -> MessageStore:
+    return MessageStore.from_messages(messages)
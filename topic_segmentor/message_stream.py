@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import heapq
+import json
+import pickle
+import re
+import tempfile
+from typing import IO, Any, Callable, Iterable, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+_WS = re.compile(r"[ \t\n\r]*")
+# strings (an unterminated one matches the lone quote), brackets and commas
+_STRUCTURE = re.compile(r'"(?:[^"\\]|\\.)*"|"|[\[\]{},]')
+
+
+def _value_closed(buf: str, pos: int) -> bool:
+    """
+    Whether the array element starting at buf[pos] is followed by its delimiter within buf,
+    i.e. failing to decode it is a syntax error and not a value cut at the chunk border.
+    """
+    depth = 0
+    for m in _STRUCTURE.finditer(buf, pos):
+        c = m.group()
+        if c == '"':
+            return False
+        if c in "[{":
+            depth += 1
+        elif c in "]}":
+            depth -= 1
+            if depth < 0:
+                return True
+        elif c == "," and depth == 0:
+            return True
+    return False
+
+
+class _ArrayReader:
+    """Incremental reader over the text of one JSON document."""
+
+    max_value_chars = 1 << 24  # an element that doesn't decode within this is an error
+
+    def __init__(self, f: IO[str], chunk_size: int):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size: Optional[int] = None) -> bool:
+        chunk = self._f.read(size or self._chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace char ("" at end of input)."""
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                pending = len(self.buf) - self.pos
+                if _value_closed(self.buf, self.pos) or pending > self.max_value_chars:
+                    raise
+                # reads grow with the pending value, so a long one is decoded O(log) times
+                if not self.fill(max(self._chunk_size, pending)):
+                    raise
+                continue
+            # a number cut at the chunk border ("12." of "12.5", "1.25" of "1.25e3") decodes
+            # "successfully" as its prefix: accept it only when an array delimiter follows
+            if isinstance(obj, (int, float)) and not isinstance(obj, bool):
+                nxt = _WS.match(self.buf, end).end()
+                if (nxt == len(self.buf) or self.buf[nxt] not in ",]") and not self.eof and self.fill():
+                    continue
+            self.pos = end
+            return obj
+
+
+def iter_json_array(path: str, chunk_size: int = 1 << 20) -> Iterator[Any]:
+    """
+    Yields the elements of a top-level JSON array one by one, reading the file
+    in chunk_size pieces instead of building the whole tree.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        reader = _ArrayReader(f, chunk_size)
+        if reader.peek() == "\ufeff":
+            reader.pos += 1
+
+        if reader.peek() != "[":
+            # not an array: keep the old json.load behaviour of iterating the document
+            f.seek(0)
+            yield from json.load(f)
+            return
+        reader.pos += 1
+
+        if reader.peek() == "]":
+            return
+        while True:
+            yield reader.value()
+            c = reader.peek()
+            reader.pos += 1
+            if c == "]":
+                return
+            if c != ",":
+                raise json.JSONDecodeError("Expecting ',' delimiter", reader.buf, reader.pos - 1)
+
+
+def _spill(items: List[T]) -> IO[bytes]:
+    f = tempfile.TemporaryFile()
+    block = 4096
+    for lo in range(0, len(items), block):
+        pickle.dump(items[lo : lo + block], f, protocol=pickle.HIGHEST_PROTOCOL)
+    f.seek(0)
+    return f
+
+
+def _read_run(f: IO[bytes]) -> Iterator[T]:
+    try:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            yield from block
+    finally:
+        f.close()
+
+
+def sorted_by_key(
+    items: Iterable[T],
+    key: Callable[[T], Any],
+    run_size: Optional[int] = None,
+) -> Iterator[T]:
+    """
+    Stable sort of a stream, same order as sorted(items, key=key).
+
+    Input that is already ordered is passed through without sorting or merging.
+    Otherwise, with run_size set, at most run_size items are held in memory:
+    sorted runs are spilled to temp files and merged back (external merge sort).
+    """
+    buffer: List[T] = []
+    runs: List[IO[bytes]] = []
+    ordered = True
+    last = None
+
+    try:
+        for item in items:
+            k = key(item)
+            if ordered and last is not None and k < last:
+                ordered = False
+            last = k
+            buffer.append(item)
+            if run_size is not None and len(buffer) >= run_size:
+                if not ordered:
+                    buffer.sort(key=key)
+                runs.append(_spill(buffer))
+                buffer = []
+    except BaseException:
+        for f in runs:
+            f.close()
+        raise
+
+    if ordered:
+        for f in runs:
+            yield from _read_run(f)
+        yield from buffer
+        return
+
+    buffer.sort(key=key)
+    if not runs:
+        yield from buffer
+        return
+    # heapq.merge prefers earlier iterables on ties, and runs are in input order -> stable
+    yield from heapq.merge(*[_read_run(f) for f in runs], iter(buffer), key=key)
+
+
+class OutOfOrderError(ValueError):
+    """An item whose key is smaller than the key of the item before it."""
+
+
+def check_ordered(items: Iterable[T], key: Callable[[T], Any]) -> Iterator[T]:
+    """
+    Passes items through, raising OutOfOrderError at the first one out of key order.
+    """
+    last = None
+    for i, item in enumerate(items):
+        k = key(item)
+        if last is not None and k < last:
+            raise OutOfOrderError(f"item {i} is out of order")
+        last = k
+        yield item
+
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+from collections import Counter
+from itertools import chain
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+
+class MessageTermAnalyzer:
+    """
+    Tokenizes single messages exactly like a fitted word TfidfVectorizer would,
+    so that a window text "m1\\nm2\\n..." can be rebuilt from per-message counts:
+    within-message n-grams plus the bigrams spanning two neighbouring messages.
+    """
+
+    def __init__(self, tfidf_feat: object):
+        if not self.supports(tfidf_feat):
+            raise ValueError("Vectorizer is not supported by the per-message cache")
+        self._preprocess = tfidf_feat.build_preprocessor()
+        self._tokenize = tfidf_feat.build_tokenizer()
+        self._stop_words = tfidf_feat.get_stop_words() or frozenset()
+        self._min_n, self._max_n = tfidf_feat.ngram_range
+        self._vocabulary = tfidf_feat.vocabulary_
+        self.n_features = len(self._vocabulary)
+        if getattr(tfidf_feat, "use_idf", True):
+            self.idf = np.asarray(tfidf_feat.idf_, dtype=np.float64)
+        else:
+            self.idf = np.ones(self.n_features, dtype=np.float64)
+
+    @staticmethod
+    def supports(tfidf_feat: object) -> bool:
+        """
+        Window counts are additive over messages only for plain word uni/bigram tf-idf
+        whose tokens never cross a line break.
+        """
+        try:
+            if tfidf_feat.analyzer != "word" or tfidf_feat.binary or tfidf_feat.sublinear_tf:
+                return False
+            min_n, max_n = tfidf_feat.ngram_range
+            if min_n < 1 or max_n > 2 or min_n > max_n:
+                return False
+            tokens = tfidf_feat.build_tokenizer()(tfidf_feat.build_preprocessor()("ab\ncd"))
+            return not any("\n" in t for t in tokens) and bool(tfidf_feat.vocabulary_)
+        except AttributeError:
+            return False
+
+    def tokens(self, text: str) -> List[str]:
+        return [t for t in self._tokenize(self._preprocess(text)) if t not in self._stop_words]
+
+    def _grams(self, toks: List[str]) -> List[str]:
+        grams: List[str] = []
+        if self._min_n == 1:
+            grams.extend(toks)
+        if self._max_n == 2:
+            grams.extend(f"{a} {b}" for a, b in zip(toks, toks[1:]))
+        return grams
+
+    def analyze(self, text: str) -> Tuple[Counter, Optional[str], Optional[str]]:
+        """
+        -> (column counts of the message's own n-grams, first token, last token)
+        """
+        return self.analyze_many([text])[0]
+
+    def analyze_many(self, texts: Sequence[str]) -> List[Tuple[Counter, Optional[str], Optional[str]]]:
+        """
+        analyze() for many messages; a vocabulary with a vectorized lookup(terms) -> cols
+        (-1 if absent) resolves all n-grams of the batch in one call.
+        """
+        tokens = [self.tokens(t) for t in texts]
+        grams = [self._grams(t) for t in tokens]
+
+        lookup = getattr(self._vocabulary, "lookup", None)
+        if lookup is None:
+            vocab = self._vocabulary
+            cols = [[c for c in map(vocab.get, g) if c is not None] for g in grams]
+        else:
+            flat = lookup(list(chain.from_iterable(grams))).tolist()
+            cols, lo = [], 0
+            for g in grams:
+                cols.append([c for c in flat[lo : lo + len(g)] if c >= 0])
+                lo += len(g)
+
+        return [
+            (Counter(c), t[0], t[-1]) if t else (Counter(c), None, None)
+            for c, t in zip(cols, tokens)
+        ]
+
+    def bigram_cols(self, tails: Sequence[str], heads: Sequence[str]) -> np.ndarray:
+        """
+        Columns of the bigrams "tail head" joining neighbouring messages, -1 if absent.
+        """
+        if self._max_n < 2 or not tails:
+            return np.full(len(tails), -1, dtype=np.int64)
+        grams = [f"{t} {h}" for t, h in zip(tails, heads)]
+        lookup = getattr(self._vocabulary, "lookup", None)
+        if lookup is not None:
+            return np.asarray(lookup(grams), dtype=np.int64)
+        vocab = self._vocabulary
+        return np.array([vocab.get(g, -1) for g in grams], dtype=np.int64)
+
+
+class MessageTfidfCache:
+    """
+    idf-weighted term counts of every message in a sequence, computed once.
+
+    Context/response cosine for a window is built from summed cached rows instead of
+    re-vectorizing the concatenated window text, so each message is tokenized once
+    no matter how many overlapping windows contain it.
+    """
+
+    def __init__(self, analyzer: MessageTermAnalyzer, texts: Sequence[str]):
+        self._build(analyzer, analyzer.analyze_many(texts))
+
+    @classmethod
+    def from_analyzed(
+        cls,
+        analyzer: MessageTermAnalyzer,
+        analyzed: Sequence[Tuple[Counter, Optional[str], Optional[str]]],
+    ) -> "MessageTfidfCache":
+        """
+        Cache over messages already passed through analyzer.analyze(), e.g. kept by a live segmenter.
+        """
+        cache = cls.__new__(cls)
+        cache._build(analyzer, analyzed)
+        return cache
+
+    def _build(
+        self,
+        analyzer: MessageTermAnalyzer,
+        analyzed: Sequence[Tuple[Counter, Optional[str], Optional[str]]],
+    ) -> None:
+        self.analyzer = analyzer
+        n = len(analyzed)
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indices: List[int] = []
+        data: List[float] = []
+        # prev[i]: last message before i that has tokens; bcol[i]: column of the bigram joining them
+        self.prev = np.full(n, -1, dtype=np.int64)
+        self.bcol = np.full(n, -1, dtype=np.int64)
+
+        joined: List[int] = []
+        tails: List[str] = []
+        heads: List[str] = []
+        last_idx, last_tail = -1, None
+        for i, (counts, head, tail) in enumerate(analyzed):
+            indices.extend(counts.keys())
+            data.extend(counts.values())
+            indptr[i + 1] = len(indices)
+            if head is None:
+                continue
+            if last_tail is not None:
+                self.prev[i] = last_idx
+                joined.append(i)
+                tails.append(last_tail)
+                heads.append(head)
+            last_idx, last_tail = i, tail
+        self.bcol[joined] = analyzer.bigram_cols(tails, heads)
+
+        counts_matrix = sp.csr_matrix(
+            (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64), indptr),
+            shape=(n, analyzer.n_features),
+        )
+        self.rows = counts_matrix @ sp.diags(analyzer.idf)
+
+    def __len__(self) -> int:
+        return self.rows.shape[0]
+
+    def window_cos(self, starts: np.ndarray, k: int) -> np.ndarray:
+        """
+        cos(tfidf(context), tfidf(response)) for windows rows[s : s + k],
+        context = first k - 1 messages joined by newlines, response = the last one.
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        w = len(starts)
+        if w == 0:
+            return np.empty(0, dtype=np.float64)
+        n_ctx = k - 1
+
+        sel_rows = np.repeat(np.arange(w), n_ctx)
+        sel_cols = (starts[:, None] + np.arange(n_ctx)[None, :]).ravel()
+        selector = sp.csr_matrix(
+            (np.ones(len(sel_rows)), (sel_rows, sel_cols)), shape=(w, len(self))
+        )
+        ctx = selector @ self.rows
+
+        # bigrams spanning two messages of the same context
+        if n_ctx > 1:
+            j = starts[:, None] + np.arange(1, n_ctx)[None, :]
+            ok = (self.bcol[j] >= 0) & (self.prev[j] >= starts[:, None])
+            win, pos = np.nonzero(ok)
+            cols = self.bcol[j[win, pos]]
+            if len(win):
+                ctx = ctx + sp.csr_matrix(
+                    (self.analyzer.idf[cols], (win, cols)), shape=ctx.shape
+                )
+
+        resp = self.rows[starts + n_ctx]
+
+        dot = np.asarray(ctx.multiply(resp).sum(axis=1)).ravel()
+        ctx_norm = np.sqrt(np.asarray(ctx.multiply(ctx).sum(axis=1)).ravel())
+        resp_norm = np.sqrt(np.asarray(resp.multiply(resp).sum(axis=1)).ravel())
+
+        denom = ctx_norm * resp_norm
+        out = np.zeros(w, dtype=np.float64)
+        np.divide(dot, denom, out=out, where=denom > 0)
+        return out
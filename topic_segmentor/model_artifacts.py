@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+from .compiled_gbdt import CompiledGBDT
+
+
+class SortedVocabulary:
+    """
+    Term -> column mapping backed by a sorted fixed-width UTF-8 array (searchsorted lookup),
+    so it can live in a memory-mapped .npy file instead of a per-process dict.
+    """
+
+    def __init__(self, terms: np.ndarray, cols: np.ndarray):
+        # plain ndarray views of np.memmap: same pages, without memmap's per-index overhead
+        self.terms = terms.view(np.ndarray)
+        self.cols = cols.view(np.ndarray)
+        self._width = terms.dtype.itemsize
+
+    @classmethod
+    def from_dict(cls, vocabulary: dict) -> "SortedVocabulary":
+        encoded = {term.encode("utf-8"): col for term, col in vocabulary.items()}
+        if any(not t or b"\x00" in t for t in encoded):
+            raise ValueError("Empty terms or terms with NUL bytes can't be stored")
+        keys = sorted(encoded)
+        return cls(np.array(keys, dtype=bytes), np.array([encoded[k] for k in keys], dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def lookup(self, terms: Sequence[str]) -> np.ndarray:
+        """
+        Columns of terms, -1 for terms not in the vocabulary.
+        """
+        if not terms or not len(self.terms):
+            return np.full(len(terms), -1, dtype=np.int64)
+        encoded = [t.encode("utf-8") for t in terms]
+        # longer queries can't match and must not be truncated to the array width
+        fits = np.fromiter((0 < len(e) <= self._width for e in encoded), dtype=bool, count=len(encoded))
+        query = np.array([e if f else b"" for e, f in zip(encoded, fits.tolist())], dtype=self.terms.dtype)
+        pos = np.minimum(np.searchsorted(self.terms, query), len(self.terms) - 1)
+        hit = fits & (self.terms[pos] == query)
+        return np.where(hit, self.cols[pos], -1)
+
+    def get(self, term: str, default: Optional[int] = None) -> Optional[int]:
+        col = int(self.lookup([term])[0])
+        return default if col < 0 else col
+
+    def __contains__(self, term: str) -> bool:
+        return self.get(term) is not None
+
+
+def _strip_accents_unicode(s: str) -> str:
+    try:
+        s.encode("ASCII", errors="strict")
+        return s
+    except UnicodeEncodeError:
+        normalized = unicodedata.normalize("NFKD", s)
+        return "".join([c for c in normalized if not unicodedata.combining(c)])
+
+
+def _strip_accents_ascii(s: str) -> str:
+    return unicodedata.normalize("NFKD", s).encode("ASCII", "ignore").decode("ASCII")
+
+
+_ACCENTS = {None: None, "unicode": _strip_accents_unicode, "ascii": _strip_accents_ascii}
+
+
+def _read_meta(path: str) -> dict:
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class MmapTfidfVectorizer:
+    """
+    The part of a fitted word-level TfidfVectorizer needed at inference time, stored as
+    meta.json + terms.npy + term_cols.npy + idf.npy and loaded with np.load(mmap_mode="r").
+
+    Exposes the attributes MessageTermAnalyzer and WindowTopicModel use (build_preprocessor,
+    build_tokenizer, get_stop_words, ngram_range, vocabulary_, idf_, transform), so it is a
+    drop-in tfidf_feat that needs neither sklearn nor a private copy of the vocabulary.
+    """
+
+    kind = "vocabulary"
+    analyzer = "word"
+    binary = False
+    sublinear_tf = False
+
+    def __init__(
+        self,
+        vocabulary: SortedVocabulary,
+        idf: np.ndarray,
+        lowercase: bool = True,
+        strip_accents: Optional[str] = None,
+        token_pattern: str = r"(?u)\b\w\w+\b",
+        ngram_range: tuple = (1, 1),
+        stop_words: Optional[Sequence[str]] = None,
+        norm: Optional[str] = "l2",
+        use_idf: bool = True,
+    ):
+        if strip_accents not in _ACCENTS:
+            raise ValueError(f"Unsupported strip_accents: {strip_accents!r}")
+        if norm not in ("l1", "l2", None):
+            raise ValueError(f"Unsupported norm: {norm!r}")
+        self.vocabulary_ = vocabulary
+        self.idf_ = idf
+        self.lowercase = lowercase
+        self.strip_accents = strip_accents
+        self.token_pattern = token_pattern
+        self.ngram_range = tuple(ngram_range)
+        self.stop_words = frozenset(stop_words) if stop_words else None
+        self.norm = norm
+        self.use_idf = use_idf
+
+    @classmethod
+    def from_sklearn(cls, tfidf_feat: object) -> "MmapTfidfVectorizer":
+        if tfidf_feat.analyzer != "word" or tfidf_feat.binary or tfidf_feat.sublinear_tf:
+            raise ValueError("Only word analyzers without binary / sublinear_tf can be exported")
+        if tfidf_feat.preprocessor is not None or tfidf_feat.tokenizer is not None:
+            raise ValueError("Custom preprocessor / tokenizer can't be exported")
+        if getattr(tfidf_feat, "input", "content") != "content":
+            raise ValueError("Only input='content' vectorizers can be exported")
+        stop_words = tfidf_feat.get_stop_words()
+        n = len(tfidf_feat.vocabulary_)
+        idf = np.asarray(tfidf_feat.idf_, dtype=np.float64) if tfidf_feat.use_idf else np.ones(n)
+        return cls(
+            vocabulary=SortedVocabulary.from_dict(tfidf_feat.vocabulary_),
+            idf=idf,
+            lowercase=tfidf_feat.lowercase,
+            strip_accents=tfidf_feat.strip_accents,
+            token_pattern=tfidf_feat.token_pattern,
+            ngram_range=tfidf_feat.ngram_range,
+            stop_words=sorted(stop_words) if stop_words else None,
+            norm=tfidf_feat.norm,
+            use_idf=tfidf_feat.use_idf,
+        )
+
+    def _meta(self) -> dict:
+        return {
+            "kind": self.kind,
+            "lowercase": self.lowercase,
+            "strip_accents": self.strip_accents,
+            "token_pattern": self.token_pattern,
+            "ngram_range": list(self.ngram_range),
+            "stop_words": sorted(self.stop_words) if self.stop_words else None,
+            "norm": self.norm,
+        }
+
+    def _write_meta(self, path: str, meta: dict) -> None:
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+
+    def save(self, path: str) -> None:
+        self._write_meta(path, {**self._meta(), "use_idf": self.use_idf})
+        np.save(os.path.join(path, "terms.npy"), self.vocabulary_.terms)
+        np.save(os.path.join(path, "term_cols.npy"), self.vocabulary_.cols)
+        np.save(os.path.join(path, "idf.npy"), self.idf_)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Optional[str] = "r") -> "MmapTfidfVectorizer":
+        def arr(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, name), mmap_mode=mmap_mode, allow_pickle=False)
+
+        meta = _read_meta(path)
+        meta.pop("kind", None)
+        return cls(vocabulary=SortedVocabulary(arr("terms.npy"), arr("term_cols.npy")), idf=arr("idf.npy"), **meta)
+
+    def build_preprocessor(self) -> Callable[[str], str]:
+        accents = _ACCENTS[self.strip_accents]
+        lower = self.lowercase
+
+        def preprocess(doc: str) -> str:
+            if lower:
+                doc = doc.lower()
+            if accents is not None:
+                doc = accents(doc)
+            return doc
+
+        return preprocess
+
+    def build_tokenizer(self) -> Callable[[str], List[str]]:
+        pattern = re.compile(self.token_pattern)
+        if pattern.groups > 1:
+            raise ValueError("token_pattern must have at most one capturing group")
+        return pattern.findall
+
+    def get_stop_words(self) -> Optional[frozenset]:
+        return self.stop_words
+
+    def _word_ngrams(self, tokens: List[str]) -> List[str]:
+        if self.stop_words is not None:
+            tokens = [t for t in tokens if t not in self.stop_words]
+        min_n, max_n = self.ngram_range
+        grams = list(tokens) if min_n == 1 else []
+        for n in range(max(min_n, 2), min(max_n, len(tokens)) + 1):
+            grams.extend(" ".join(tokens[i : i + n]) for i in range(len(tokens) - n + 1))
+        return grams
+
+    def transform(self, texts: Sequence[str]):
+        """
+        Same tf-idf rows as the sklearn vectorizer (float64 CSR, rows normalized by norm).
+        """
+        import scipy.sparse as sp
+
+        preprocess, tokenize = self.build_preprocessor(), self.build_tokenizer()
+        grams = [self._word_ngrams(tokenize(preprocess(t))) for t in texts]
+        counts = [Counter(c for c in self.vocabulary_.lookup(g).tolist() if c >= 0) for g in grams]
+
+        indptr = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(c) for c in counts], out=indptr[1:])
+        indices = np.fromiter((k for c in counts for k in c.keys()), dtype=np.int64, count=int(indptr[-1]))
+        data = np.fromiter((v for c in counts for v in c.values()), dtype=np.float64, count=int(indptr[-1]))
+        X = sp.csr_matrix((data, indices, indptr), shape=(len(texts), len(self.vocabulary_)))
+        X.sort_indices()
+
+        X.data *= np.asarray(self.idf_)[X.indices]
+        if self.norm is not None:
+            rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+            weights = X.data ** 2 if self.norm == "l2" else np.abs(X.data)
+            norms = np.bincount(rows, weights=weights, minlength=X.shape[0])
+            if self.norm == "l2":
+                norms = np.sqrt(norms)
+            norms[norms == 0.0] = 1.0
+            X.data /= norms[rows]
+        return X
+
+
+def load_vectorizer(path: str, mmap_mode: Optional[str] = "r") -> MmapTfidfVectorizer:
+    """
+    Loads a vectorizer directory written by MmapTfidfVectorizer or HashedTfidfVectorizer.
+    """
+    kind = _read_meta(path).get("kind", MmapTfidfVectorizer.kind)
+    if kind == MmapTfidfVectorizer.kind:
+        return MmapTfidfVectorizer.load(path, mmap_mode=mmap_mode)
+    if kind == "hashed":
+        from .hashed_tfidf import HashedTfidfVectorizer
+
+        return HashedTfidfVectorizer.load(path, mmap_mode=mmap_mode)
+    raise ValueError(f"Unknown vectorizer kind {kind!r} in {path}")
+
+
+def export_model_artifacts(tfidf_feat: object, gbdt: object, out_dir: str) -> None:
+    """
+    Writes out_dir/vectorizer and out_dir/gbdt; pass them as tfidf_path / model_path.
+    """
+    MmapTfidfVectorizer.from_sklearn(tfidf_feat).save(os.path.join(out_dir, "vectorizer"))
+    CompiledGBDT.from_sklearn(gbdt).save(os.path.join(out_dir, "gbdt"))
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export joblib models into the memory-mapped artifact format.")
+    parser.add_argument("tfidf_path", help="e.g. models/tfidf_feat.joblib")
+    parser.add_argument("model_path", help="e.g. models/gbdt_topic_window.joblib")
+    parser.add_argument("-o", "--out-dir", default="models/window_model")
+    args = parser.parse_args(argv)
+
+    import joblib
+
+    export_model_artifacts(joblib.load(args.tfidf_path), joblib.load(args.model_path), args.out_dir)
+    print(f"Saved artifacts to {args.out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Deque, List, Optional
+
+from .topic_segmentor import ChatMessage, Topic
+from .hybrid_timegap_topic_segmentor import HybridTimeGapMLTopicSegmentor
+from .message_tfidf_cache import MessageTfidfCache
+
+
+class OnlineHybridSegmentor:
+    """
+    Incremental HybridTimeGapMLTopicSegmentor for live chats: messages are pushed one by one
+    and push() returns the topics closed by that message.
+
+    Greedy selection by window end is decided at the moment a window ends, so every message
+    closes at most one topic and the stream yields the same topics as an offline run on
+    the same messages. Only the last topic_size messages of the open session are kept,
+    each message is tokenized once and scored in one window: O(1) work per message.
+    """
+
+    def __init__(self, segmentor: HybridTimeGapMLTopicSegmentor):
+        if segmentor.selection != "greedy":
+            raise ValueError("Online segmentation supports only greedy selection")
+        self._seg = segmentor
+        self._model = segmentor._model
+        self._k = segmentor.get_topic_size()
+        self._analyzer = self._model.message_analyzer()
+        self.reset()
+
+    def reset(self) -> None:
+        self._window: Deque[ChatMessage] = deque(maxlen=self._k)
+        self._analyzed: Deque[tuple] = deque(maxlen=self._k)
+        self._count = 0  # messages pushed so far, index of the next one
+        self._last_end = -1  # end index of the last accepted topic
+
+    def push(self, message: ChatMessage) -> List[Topic]:
+        if self._window and message.timestamp - self._window[-1].timestamp > self._seg.max_gap_seconds:
+            # new session: windows never span a long gap
+            self._window.clear()
+            self._analyzed.clear()
+
+        self._window.append(message)
+        if self._analyzer is not None:
+            self._analyzed.append(self._analyzer.analyze(f"{message.user}: {message.text}"))
+        self._count += 1
+
+        if len(self._window) < self._k:
+            return []
+        start = self._count - self._k
+        if start < self._last_end:
+            return []
+
+        p = self._score()
+        if p < self._seg.threshold:
+            return []
+        self._last_end = self._count
+        return [list(self._window)]
+
+    def _score(self) -> float:
+        window = list(self._window)
+        cache: Optional[MessageTfidfCache] = None
+        if self._analyzer is not None:
+            cache = MessageTfidfCache.from_analyzed(self._analyzer, list(self._analyzed))
+        x = self._model.featurize_windows(window, [0], cache)
+        return float(self._model.gbdt.predict_proba(x)[0, 1])
@@ -1,9 +1,108 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
+from typing import List, Sequence, Tuple
+
+import numpy as np
 
 from .topic_segmentor import TopicSegmentor, Topic, ChatMessage
+from .message_store import MessageStore, NO_REPLY
+
+
+class ReplyForest:
+    """
+    Reply links of a message sequence resolved to indices, built once per load.
+
+    parent[i] is the index of the message i replies to (-1 if none or unknown);
+    like the by_id dict it replaces, a duplicated id resolves to its last message.
+    Reply cycles are possible in raw data, so depths are always capped.
+    """
+
+    def __init__(self, ids: np.ndarray, timestamps: np.ndarray, reply_to_ids: np.ndarray):
+        n = len(ids)
+        has_reply = reply_to_ids != NO_REPLY
+        order = np.argsort(ids, kind="stable")
+        sorted_ids = ids[order]
+        # stable order -> the rightmost equal id is the last message with that id
+        pos = np.searchsorted(sorted_ids, reply_to_ids, side="right") - 1
+        found = has_reply & (pos >= 0)
+        found[found] = sorted_ids[pos[found]] == reply_to_ids[found]
+
+        self.ids = ids
+        self.timestamps = timestamps
+        self.has_reply = has_reply
+        self.parent = np.full(n, -1, dtype=np.int64)
+        self.parent[found] = order[pos[found]]
+        # binary lifting table: _up[j][i] = 2**j-th ancestor of i, -1 past the root
+        self._up: List[np.ndarray] = [self.parent]
+
+    @classmethod
+    def from_messages(cls, messages: Sequence[ChatMessage]) -> "ReplyForest":
+        if isinstance(messages, MessageStore):
+            return cls(messages.ids, messages.timestamps, messages.reply_to_ids)
+        n = len(messages)
+        return cls(
+            np.fromiter((m.id for m in messages), dtype=np.int64, count=n),
+            np.fromiter((m.timestamp for m in messages), dtype=np.int64, count=n),
+            np.fromiter(
+                (NO_REPLY if m.reply_to_id is None else m.reply_to_id for m in messages),
+                dtype=np.int64,
+                count=n,
+            ),
+        )
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    def _lift(self, level: int) -> np.ndarray:
+        while len(self._up) <= level:
+            prev = self._up[-1]
+            nxt = np.full_like(prev, -1)
+            ok = prev >= 0
+            nxt[ok] = prev[prev[ok]]
+            self._up.append(nxt)
+        return self._up[level]
+
+    def depth(self, cap: int) -> np.ndarray:
+        """
+        Number of reachable ancestors of every message, capped at cap.
+        """
+        n = len(self)
+        depth = np.zeros(n, dtype=np.int64)
+        if cap <= 0 or n == 0:
+            return depth
+        cur = np.arange(n)
+        for level in range(int(cap).bit_length() - 1, -1, -1):
+            step = 1 << level
+            nxt = np.full(n, -1, dtype=np.int64)
+            alive = cur >= 0
+            nxt[alive] = self._lift(level)[cur[alive]]
+            jump = (nxt >= 0) & (depth + step <= cap)
+            depth[jump] += step
+            cur = np.where(jump, nxt, cur)
+        return depth
+
+    def ancestors(self, nodes: np.ndarray, n: int) -> np.ndarray:
+        """
+        (len(nodes), n + 1) matrix [node, parent, grandparent, ...], -1 where the chain ends.
+        """
+        out = np.full((len(nodes), n + 1), -1, dtype=np.int64)
+        out[:, 0] = nodes
+        for j in range(1, n + 1):
+            prev = out[:, j - 1]
+            ok = prev >= 0
+            out[ok, j] = self.parent[prev[ok]]
+        return out
+
+    def valid_windows(self, windows: np.ndarray) -> np.ndarray:
+        """
+        Rows of a (windows, size) index matrix with non-decreasing timestamps and unique ids.
+        """
+        ts = self.timestamps[windows]
+        ok = np.all(ts[:, :-1] <= ts[:, 1:], axis=1)
+        ids = np.sort(self.ids[windows], axis=1)
+        ok &= np.all(ids[:, :-1] != ids[:, 1:], axis=1)
+        return ok
 
 
 @dataclass
@@ -26,67 +125,39 @@ class ReplyChainTopicSegmentor(TopicSegmentor):
         self._max_chain_hops = max_chain_hops
         self._non_overlapping = non_overlapping
 
-    def _build_candidate_window(
-        self,
-        resp: ChatMessage,
-        by_id: Dict[int, ChatMessage],
-        topic_size: int,
-    ) -> Optional[Topic]:
-        if resp.reply_to_id is None:
-            return None
-
-        chain: List[ChatMessage] = [resp]
-        cur: Optional[ChatMessage] = resp
-        hops = 0
+    def _candidate_windows(self, forest: ReplyForest, topic_size: int) -> np.ndarray:
+        """
+        (candidates, topic_size) message indices, oldest first, one row per response
+        whose reply chain yields a valid window, in message order.
+        """
+        n_ctx = topic_size - 1
+        if n_ctx > self._max_chain_hops:
+            return np.empty((0, topic_size), dtype=np.int64)
 
-        while cur is not None and cur.reply_to_id is not None and hops < self._max_chain_hops:
-            parent = by_id.get(cur.reply_to_id)
-            if parent is None:
-                break
-            chain.append(parent)
-            cur = parent
-            hops += 1
+        resp = np.flatnonzero(forest.has_reply & (forest.depth(n_ctx) >= n_ctx))
+        windows = forest.ancestors(resp, n_ctx)[:, ::-1]
+        return windows[forest.valid_windows(windows)]
 
-        chain.reverse()
-
-        if len(chain) < topic_size:
-            return None
-
-        window = chain[-topic_size:]
-
-        if any(window[i].timestamp > window[i + 1].timestamp for i in range(len(window) - 1)):
-            return None
-
-        ids = [m.id for m in window]
-        if len(set(ids)) != len(ids):
-            return None
-
-        return window
-
-    def get_topics(self, path: str) -> List[Topic]:
-        messages = self.load_messages(path)
+    def segment(self, messages: Sequence[ChatMessage]) -> List[Topic]:
         if not messages:
             return []
 
-        by_id: Dict[int, ChatMessage] = {m.id: m for m in messages}
-        topic_size = self.get_topic_size()
-
-        candidates: List[Tuple[int, Topic]] = []
-        for resp in messages:
-            window = self._build_candidate_window(resp, by_id, topic_size)
-            if window is None:
-                continue
-            end_ts = window[-1].timestamp
-            candidates.append((end_ts, window))
+        forest = ReplyForest.from_messages(messages)
+        windows = self._candidate_windows(forest, self.get_topic_size())
 
         # earliest responses first
-        candidates.sort(key=lambda x: x[0])
+        order = np.argsort(forest.timestamps[windows[:, -1]], kind="stable")
+        windows = windows[order]
+        candidates: List[Tuple[List[int], Topic]] = [
+            (w_ids, [messages[i] for i in w])
+            for w, w_ids in zip(windows.tolist(), forest.ids[windows].tolist())
+        ]
 
         if not self._non_overlapping:
             seen = set()
             out: List[Topic] = []
-            for _, w in candidates:
-                sig = tuple(m.id for m in w)
+            for w_ids, w in candidates:
+                sig = tuple(w_ids)
                 if sig in seen:
                     continue
                 seen.add(sig)
@@ -98,17 +169,16 @@ class ReplyChainTopicSegmentor(TopicSegmentor):
         picked: List[Topic] = []
         seen_sigs = set()
 
-        for _, window in candidates:
-            sig = tuple(m.id for m in window)
+        for w_ids, window in candidates:
+            sig = tuple(w_ids)
             if sig in seen_sigs:
                 continue
             seen_sigs.add(sig)
 
-            ids = [m.id for m in window]
-            if any(mid in used_ids for mid in ids):
+            if any(mid in used_ids for mid in w_ids):
                 continue
 
             picked.append(window)
-            used_ids.update(ids)
+            used_ids.update(w_ids)
 
         return picked
\ No newline at end of file
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import List
+from typing import Iterator, List, Sequence, Tuple
 
-from .topic_segmentor import TopicSegmentor, Topic, ChatMessage
+import numpy as np
+
+from .topic_segmentor import TopicSegmentor, Topic, ChatMessage, MessageSource
+from .message_store import MessageStore
 
 
 @dataclass
@@ -19,29 +22,48 @@ class TimeGapTopicSegmentor(TopicSegmentor):
         super().__init__(topic_size)
         self.__max_gap_seconds = max_gap_seconds
 
-    def get_topics(self, path: str) -> List[Topic]:
-        messages = self.load_messages(path)
-        if not messages:
-            return []
+    def topic_ranges(self, timestamps: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Topics as (start, end) index arrays over timestamp-ordered messages.
 
-        topics: List[Topic] = []
-        current: Topic = [messages[0]]
+        Same result as the greedy walk: every run of messages without a gap larger
+        than max_gap_seconds is cut into consecutive blocks of topic_size,
+        the incomplete tail block of each run is dropped.
+        """
+        k = self.get_topic_size()
+        n = len(timestamps)
+        if n == 0 or k < 2:
+            # the greedy walk never emits single-message topics
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
 
-        for msg in messages[1:]:
-            prev: ChatMessage = current[-1]
+        breaks = np.flatnonzero(np.diff(timestamps) > self.__max_gap_seconds) + 1
+        run_start = np.concatenate(([0], breaks)).astype(np.int64)
+        run_end = np.concatenate((breaks, [n])).astype(np.int64)
 
-            time_ok = (msg.timestamp - prev.timestamp) <= self.__max_gap_seconds
-            size_ok = len(current) < self.get_topic_size()
+        counts = (run_end - run_start) // k
+        total = int(counts.sum())
+        first = np.cumsum(counts) - counts
+        block = np.arange(total) - np.repeat(first, counts)
+        starts = np.repeat(run_start, counts) + block * k
+        return starts, starts + k
 
-            if time_ok and size_ok:
-                current.append(msg)
-            else:
-                if len(current) > 1:
-                    topics.append(current)
-                current = [msg]
+    def iter_topics(self, source: MessageSource, chunk_messages: int = 10_000) -> Iterator[Topic]:
+        """
+        Streams topics chunk by chunk; chunks hold whole gap-separated runs of at least
+        chunk_messages messages, so memory and latency are bounded by the chunk, not the chat.
+        """
+        for chunk in self._iter_gap_chunks(source, self.__max_gap_seconds, chunk_messages):
+            yield from self.segment(chunk)
+
+    def segment(self, messages: Sequence[ChatMessage]) -> List[Topic]:
+        if not messages:
+            return []
 
-        if len(current) > 1:
-            topics.append(current)
+        if isinstance(messages, MessageStore):
+            timestamps = messages.timestamps
+        else:
+            timestamps = np.fromiter((m.timestamp for m in messages), dtype=np.int64, count=len(messages))
 
-        return [t for t in topics if len(t) == self.get_topic_size()]
-    
\ No newline at end of file
+        starts, ends = self.topic_ranges(timestamps)
+        return [list(messages[s:e]) for s, e in zip(starts.tolist(), ends.tolist())]
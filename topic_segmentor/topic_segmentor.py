@@ -1,9 +1,11 @@
 from __future__ import annotations
 
-import json
+import os
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Iterable, Iterator, List, Optional, Sequence, Union
+
+from .message_stream import check_ordered, iter_json_array
 
 
 @dataclass(frozen=True)
@@ -17,6 +19,10 @@ class ChatMessage:
 
 Topic = List[ChatMessage]
 
+# a JSON file path or timestamp-ordered messages (list, MessageStore, generator, ...);
+# a path is streamed as it is read and must be ordered too (see iter_messages)
+MessageSource = Union[str, "os.PathLike[str]", Iterable[ChatMessage]]
+
 
 class TopicSegmentor(ABC):
     __topic_size: int = 4
@@ -30,58 +36,142 @@ class TopicSegmentor(ABC):
         return self.__topic_size
 
     @abstractmethod
-    def get_topics(self, path: str) -> List[Topic]:
+    def segment(self, messages: Sequence[ChatMessage]) -> List[Topic]:
+        """
+        Topics of timestamp-ordered messages: a list of ChatMessage or a MessageStore.
+        """
         raise NotImplementedError
 
+    def iter_topics(self, source: MessageSource) -> Iterator[Topic]:
+        """
+        Yields topics of a JSON file path or of timestamp-ordered messages (any iterable).
+        The default segments everything at once; subclasses yield as soon as topics are final.
+        """
+        # a path is a Sequence too (of characters): _message_sequence loads it as messages
+        yield from self.segment(self._message_sequence(source))
+
+    def get_topics(self, path: str) -> List[Topic]:
+        """
+        All topics of a JSON file (loaded and sorted by timestamp) or of ordered messages.
+        """
+        return self.segment(self._message_sequence(path))
+
+    def _message_source(self, source: MessageSource) -> Iterable[ChatMessage]:
+        if isinstance(source, (str, os.PathLike)):
+            return self.iter_messages(os.fspath(source))
+        return source
+
+    def _message_sequence(self, source: MessageSource) -> Sequence[ChatMessage]:
+        """
+        The whole chat at once, for consumers that need it: files are fully sorted by timestamp.
+        """
+        if isinstance(source, (str, os.PathLike)):
+            from .message_store import MessageStore
+
+            return MessageStore.load(os.fspath(source))
+        return source if isinstance(source, Sequence) else list(self._message_source(source))
+
+    def _iter_gap_chunks(
+        self,
+        source: MessageSource,
+        max_gap_seconds: int,
+        chunk_messages: int,
+    ) -> Iterator[Sequence[ChatMessage]]:
+        """
+        Splits a message stream at gaps > max_gap_seconds and yields runs of whole
+        sessions with at least chunk_messages messages (the last one may be shorter),
+        so a chunk never cuts through a session.
+        """
+        from .message_store import MessageStore
+
+        if isinstance(source, MessageStore):
+            import numpy as np
+
+            n = len(source)
+            breaks = (np.flatnonzero(np.diff(source.timestamps) > max_gap_seconds) + 1).tolist()
+            lo = 0
+            for b in breaks + [n]:
+                if b - lo >= chunk_messages or b == n:
+                    if b > lo:
+                        yield source.slice(lo, b)
+                    lo = b
+            return
+
+        chunk: List[ChatMessage] = []
+        for m in self._message_source(source):
+            if chunk and m.timestamp - chunk[-1].timestamp > max_gap_seconds and len(chunk) >= chunk_messages:
+                yield chunk
+                chunk = []
+            chunk.append(m)
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def read_messages(path: str) -> Iterator[ChatMessage]:
+        """
+        Streams validated messages of a JSON array file in file order.
+        """
+        return (m for m in map(parse_message, iter_json_array(path)) if m is not None)
+
+    @staticmethod
+    def iter_messages(path: str) -> Iterator[ChatMessage]:
+        """
+        Streams validated messages of a timestamp-ordered JSON array file (chat exports are),
+        each one as soon as it is read. Raises OutOfOrderError at the first message older
+        than the one before it: load_messages / MessageStore.load sort any file.
+        """
+        return check_ordered(TopicSegmentor.read_messages(path), key=_message_timestamp)
+
     @staticmethod
     def load_messages(path: str) -> List[ChatMessage]:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        messages: List[ChatMessage] = []
-        for item in data:
-            if not isinstance(item, dict):
-                continue
-
-            msg_id = item.get("id")
-            username = item.get("user")
-            content = item.get("text")
-            timestamp = item.get("timestamp")
-            reply_to_id = item.get("reply_to_id", None)
-
-            try:
-                msg_id_int = int(msg_id)
-            except (TypeError, ValueError):
-                continue
-
-            if not isinstance(username, str) or not username:
-                continue
-            if not isinstance(content, str) or not content.strip():
-                continue
-            if timestamp is None:
-                continue
-
-            try:
-                ts = int(timestamp)
-            except (TypeError, ValueError):
-                continue
-
-            rpl: Optional[int] = None
-            if reply_to_id is not None:
-                try:
-                    rpl = int(reply_to_id)
-                except (TypeError, ValueError):
-                    rpl = None
-
-            messages.append(
-                ChatMessage(
-                    id=msg_id_int,
-                    user=username,
-                    text=content.strip(),
-                    timestamp=ts,
-                    reply_to_id=rpl,
-                )
-            )
-
-        messages.sort(key=lambda m: m.timestamp)
-        return messages
+        return sorted(TopicSegmentor.read_messages(path), key=_message_timestamp)
+
+
+def _message_timestamp(m: ChatMessage) -> int:
+    return m.timestamp
+
+
+def parse_message(item: object) -> Optional[ChatMessage]:
+    """
+    Validates one raw JSON item, None if it is not a usable message.
+    """
+    if not isinstance(item, dict):
+        return None
+
+    msg_id = item.get("id")
+    username = item.get("user")
+    content = item.get("text")
+    timestamp = item.get("timestamp")
+    reply_to_id = item.get("reply_to_id", None)
+
+    try:
+        msg_id_int = int(msg_id)
+    except (TypeError, ValueError):
+        return None
+
+    if not isinstance(username, str) or not username:
+        return None
+    if not isinstance(content, str) or not content.strip():
+        return None
+    if timestamp is None:
+        return None
+
+    try:
+        ts = int(timestamp)
+    except (TypeError, ValueError):
+        return None
+
+    rpl: Optional[int] = None
+    if reply_to_id is not None:
+        try:
+            rpl = int(reply_to_id)
+        except (TypeError, ValueError):
+            rpl = None
+
+    return ChatMessage(
+        id=msg_id_int,
+        user=username,
+        text=content.strip(),
+        timestamp=ts,
+        reply_to_id=rpl,
+    )
@@ -1,12 +1,14 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import List
+import os
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
 import numpy as np
-import joblib
-from sklearn.metrics.pairwise import cosine_similarity
 
 from .topic_segmentor import ChatMessage
+from .message_store import MessageStore, as_store
+from .message_tfidf_cache import MessageTermAnalyzer, MessageTfidfCache
+from .compiled_gbdt import CompiledGBDT
 
 
 @dataclass
@@ -14,24 +16,49 @@ class WindowTopicModel:
     """
     Predicts P(window is single-topic) for a fixed-size window (topic_size messages).
     Uses:
-      - tfidf_feat: TfidfVectorizer
-      - gbdt: any sklearn classifier with predict_proba
+      - tfidf_feat: TfidfVectorizer, or MmapTfidfVectorizer / HashedTfidfVectorizer (directory tfidf_path)
+      - gbdt: any sklearn classifier with predict_proba, or a CompiledGBDT (*.npz / directory model_path)
+
+    Directories written by model_artifacts.export_model_artifacts are memory-mapped,
+    so processes loading the same artifacts share one copy of the vocabulary and trees.
     """
     tfidf_feat: object
     gbdt: object
     topic_size: int = 4
+    batch_size: int = 8192
+    _analyzer: Optional[MessageTermAnalyzer] = field(default=None, init=False, repr=False)
 
     @classmethod
-    def load(cls, tfidf_path: str, model_path: str, topic_size: int = 4) -> "WindowTopicModel":
-        tfidf_feat = joblib.load(tfidf_path)
-        gbdt = joblib.load(model_path)
-        return cls(tfidf_feat=tfidf_feat, gbdt=gbdt, topic_size=topic_size)
+    def load(
+        cls,
+        tfidf_path: str,
+        model_path: str,
+        topic_size: int = 4,
+        batch_size: int = 8192,
+    ) -> "WindowTopicModel":
+        if os.path.isdir(tfidf_path):
+            from .model_artifacts import load_vectorizer
+
+            tfidf_feat = load_vectorizer(tfidf_path)
+        else:
+            import joblib
+
+            tfidf_feat = joblib.load(tfidf_path)
+        if os.path.isdir(model_path) or model_path.endswith(".npz"):
+            gbdt = CompiledGBDT.load(model_path)
+        else:
+            import joblib
+
+            gbdt = joblib.load(model_path)
+        return cls(tfidf_feat=tfidf_feat, gbdt=gbdt, topic_size=topic_size, batch_size=batch_size)
 
     @staticmethod
     def _window_to_text(msgs: List[ChatMessage]) -> str:
         return "\n".join([f"{m.user}: {m.text}" for m in msgs])
 
     def _tfidf_cos(self, a: str, b: str) -> float:
+        from sklearn.metrics.pairwise import cosine_similarity
+
         X = self.tfidf_feat.transform([a, b])
         return float(cosine_similarity(X[0], X[1])[0, 0])
 
@@ -70,6 +97,116 @@ class WindowTopicModel:
         )
         return feats
 
+    def _tfidf_cos_batch(self, a: List[str], b: List[str]) -> np.ndarray:
+        from sklearn.preprocessing import normalize
+
+        # one transform for the whole chunk, then row-wise cosine (same as _tfidf_cos per pair)
+        X = normalize(self.tfidf_feat.transform(a + b))
+        A, B = X[: len(a)], X[len(a) :]
+        return np.asarray(A.multiply(B).sum(axis=1), dtype=np.float64).ravel()
+
+    def message_analyzer(self) -> Optional[MessageTermAnalyzer]:
+        """
+        Per-message tokenizer matching tfidf_feat, None if the vectorizer can't be split per message.
+        """
+        if self._analyzer is None and MessageTermAnalyzer.supports(self.tfidf_feat):
+            self._analyzer = MessageTermAnalyzer(self.tfidf_feat)
+        return self._analyzer
+
+    def _message_cache(self, msgs: Sequence[ChatMessage]) -> Optional[MessageTfidfCache]:
+        if self.message_analyzer() is None:
+            return None
+        if isinstance(msgs, MessageStore):
+            users, codes = msgs.users, msgs.user_codes.tolist()
+            texts = [f"{users[c]}: {t}" for c, t in zip(codes, msgs.texts())]
+        else:
+            texts = [f"{m.user}: {m.text}" for m in msgs]
+        return MessageTfidfCache(self._analyzer, texts)
+
+    def featurize_windows(
+        self,
+        msgs: Sequence[ChatMessage],
+        starts: Sequence[int],
+        cache: Optional[MessageTfidfCache] = None,
+    ) -> np.ndarray:
+        """
+        Features of windows msgs[s : s + topic_size] for s in starts: shape (len(starts), 6).
+        With a per-message cache the TF-IDF similarity is built from cached rows.
+        """
+        k = self.topic_size
+        starts = np.asarray(starts, dtype=np.int64)
+        if len(starts) == 0:
+            return np.empty((0, 6), dtype=np.float32)
+        if starts.min() < 0 or starts.max() + k > len(msgs):
+            raise ValueError(f"Window of size {k} out of range for {len(msgs)} messages")
+        store = as_store(msgs)
+
+        if cache is not None:
+            sims = cache.window_cos(starts, k)
+        else:
+            ctx_texts = ["\n".join([f"{m.user}: {m.text}" for m in store[s : s + k - 1]]) for s in starts]
+            resp_texts = [f"{store.user(s + k - 1)}: {store.text(s + k - 1)}" for s in starts]
+            sims = self._tfidf_cos_batch(ctx_texts, resp_texts)
+
+        # (windows, k - 1) gaps between neighbours, (windows, k) user codes
+        pos = starts[:, None] + np.arange(k)[None, :]
+        ts = store.timestamps
+        dts = np.maximum(0, ts[pos[:, 1:]] - ts[pos[:, :-1]])
+        users = store.user_codes[pos]
+        sorted_users = np.sort(users, axis=1)
+        num_unique_users = 1 + np.count_nonzero(np.diff(sorted_users, axis=1), axis=1)
+        resp_user_seen = (users[:, :-1] == users[:, -1:]).any(axis=1)
+        question_in_last_context = np.fromiter(
+            ("?" in store.text(i) for i in (starts + k - 2).tolist()), dtype=bool, count=len(starts)
+        )
+
+        feats = np.empty((len(starts), 6), dtype=np.float32)
+        feats[:, 0] = sims
+        feats[:, 1] = np.log1p(dts.max(axis=1))
+        feats[:, 2] = np.log1p(dts[:, -1])
+        feats[:, 3] = num_unique_users
+        feats[:, 4] = resp_user_seen
+        feats[:, 5] = question_in_last_context
+        return feats
+
+    def featurize_batch(self, windows: Sequence[List[ChatMessage]]) -> np.ndarray:
+        """
+        Same features as featurize(), for many windows at once: shape (len(windows), 6).
+        """
+        for w in windows:
+            if len(w) != self.topic_size:
+                raise ValueError(f"Expected window size {self.topic_size}, got {len(w)}")
+        flat = [m for w in windows for m in w]
+        starts = np.arange(0, len(flat), self.topic_size)
+        return self.featurize_windows(flat, starts, self._message_cache(flat))
+
     def predict_proba_single_topic(self, msgs: List[ChatMessage]) -> float:
         x = self.featurize(msgs).reshape(1, -1)
-        return float(self.gbdt.predict_proba(x)[0, 1])
\ No newline at end of file
+        return float(self.gbdt.predict_proba(x)[0, 1])
+
+    def predict_proba_windows(self, msgs: Sequence[ChatMessage], starts: Sequence[int]) -> np.ndarray:
+        """
+        P(single-topic) for windows msgs[s : s + topic_size]; messages are vectorized once,
+        then one featurize + predict_proba call per batch_size chunk of windows.
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        out = np.empty(len(starts), dtype=np.float64)
+        if len(starts) == 0:
+            return out
+        msgs = as_store(msgs)
+        cache = self._message_cache(msgs)
+        for lo in range(0, len(starts), self.batch_size):
+            chunk = starts[lo : lo + self.batch_size]
+            x = self.featurize_windows(msgs, chunk, cache)
+            out[lo : lo + len(chunk)] = self.gbdt.predict_proba(x)[:, 1]
+        return out
+
+    def predict_proba_batch(self, windows: Sequence[List[ChatMessage]]) -> np.ndarray:
+        """
+        P(single-topic) for every window, see predict_proba_windows().
+        """
+        for w in windows:
+            if len(w) != self.topic_size:
+                raise ValueError(f"Expected window size {self.topic_size}, got {len(w)}")
+        flat = [m for w in windows for m in w]
+        return self.predict_proba_windows(flat, np.arange(0, len(flat), self.topic_size))